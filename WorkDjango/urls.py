@@ -15,12 +15,17 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+
+# Registers the ModelAdmins when the production profile skipped the
+# autodiscovery at startup; does nothing otherwise
+admin.autodiscover()
 
 admin.site.site_header = "Work Hour Management Adminstration"
 admin.site.site_title = "Work Hour"
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('linear/', include('linear.urls')),
     path('', admin.site.login),
 ]
@@ -1,6 +1,32 @@
 from django.contrib import admin
+from django.utils import timezone
 from .models import Work
+from . import ledger, summary
 
 @admin.action(description="Mark selected works as overwork")
 def mark_as_overwork(modeladmin, request, queryset):
-    queryset.update(overwork_day=True)
\ No newline at end of file
+    # update() skips the signals that keep the ledger in sync, and auto_now
+    days = {ledger.work_day(w) for w in queryset.only('start')}
+    queryset.update(overwork_day=True, updated_at=timezone.now())
+    ledger.refresh_days(days)
+    summary.invalidate()
+
+
+def _enqueue_export(request, queryset, file_format):
+    from .jobs import enqueue, selection
+    from .models import Issue, Job
+
+    kind = Job.EXPORT_ISSUES if queryset.model is Issue else Job.EXPORT_WORKS
+    return enqueue(kind, user=request.user, format=file_format, **selection(request))
+
+
+@admin.action(description="Export selected as CSV in the background")
+def export_csv_in_background(modeladmin, request, queryset):
+    job = _enqueue_export(request, queryset, 'csv')
+    modeladmin.message_user(request, f"{job} queued; download it from the job list when it is done.")
+
+
+@admin.action(description="Export selected as XLSX in the background")
+def export_xlsx_in_background(modeladmin, request, queryset):
+    job = _enqueue_export(request, queryset, 'xlsx')
+    modeladmin.message_user(request, f"{job} queued; download it from the job list when it is done.")
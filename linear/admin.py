@@ -1,25 +1,73 @@
-import math
-from django.contrib import admin
-from django.db.models import ExpressionWrapper, F, DurationField, Sum
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db.models import QuerySet, Sum
 from django.utils.formats import number_format
 from datetime import timedelta
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
 from import_export.admin import ImportExportModelAdmin
 from import_export.formats import base_formats
 from import_export import resources, fields
+from import_export.signals import post_export
+from import_export import widgets
 from import_export.widgets import ForeignKeyWidget
-from .models import Issue, Work
-from .actions import mark_as_overwork
+from itertools import islice
+from .models import Issue, Job, OverworkPolicy, PayrollRollup, Work
+from .actions import export_csv_in_background, export_xlsx_in_background, mark_as_overwork
+from .export import stream_csv, write_xlsx
+from .filters import IssueOverworkListFilter, JalaliMonthListFilter, OverlapListFilter, OverworkListFilter
+from . import instrumentation, jobs, ledger, payroll, policy, routers, summary, timeseries
+from .overwork import prefetch_overwork
 
 
 class WorkInline(admin.TabularInline):
     model = Work
     extra = 1
 
+class IssueResource(resources.ModelResource):
+    # The totals are exported but maintained from Work, never imported
+    total_duration = fields.Field(attribute='total_duration', column_name='total_duration', readonly=True, widget=widgets.DurationWidget())
+    total_overwork = fields.Field(attribute='total_overwork', column_name='total_overwork', readonly=True, widget=widgets.DurationWidget())
+    work_count = fields.Field(attribute='work_count', column_name='work_count', readonly=True, widget=widgets.IntegerWidget())
+
+    class Meta:
+        model = Issue
+        fields = ('id', 'title', 'total_duration', 'total_overwork', 'work_count')
+
+
 @admin.register(Issue)
 class IssueAdmin(ImportExportModelAdmin):
-    list_display = ('title', 'duration')
+    list_display = ('title', 'duration', 'overwork', 'work_count')
+    list_filter = (IssueOverworkListFilter,)
     inlines = [WorkInline]
+    actions = [export_csv_in_background, export_xlsx_in_background]
     formats = [base_formats.CSV, base_formats.XLSX]
+    resource_class = IssueResource
+    # Adds the totals above the import/export page
+    import_export_change_list_template = 'admin/linear/Issue/change_list.html'
+
+    # The totals are stored on Issue, so the columns, sorting and
+    # filtering need no query per Issue
+    @admin.display(description="duration", ordering='total_duration')
+    def duration(self, obj):
+        return obj.total_duration
+
+    @admin.display(description="overwork", ordering='total_overwork')
+    def overwork(self, obj):
+        return obj.total_overwork
+
+    def get_changelist_totals(self, cl):
+        """
+        Total duration, total overwork and pay of the filtered Issues.
+        """
+        totals = cl.queryset.aggregate(total_duration=Sum('total_duration'), total_overwork=Sum('total_overwork'))
+        # Pay from the payroll rollups, grouped by overwork policy so each
+        # period is paid at its rates
+        value = payroll.pay(PayrollRollup.objects.filter(issue__in=cl.queryset))
+        return totals['total_duration'] or timedelta(), totals['total_overwork'] or timedelta(), value
 
     def changelist_view(self, request, extra_context=None):
         # Call the superclass to get the default context
@@ -29,61 +77,106 @@ class IssueAdmin(ImportExportModelAdmin):
         try:
             cl = response.context_data.get('cl')
             if cl:
-               # Annotate each Issue with its total duration
-                queryset = cl.queryset.annotate(
-                    total_duration=ExpressionWrapper(
-                        Sum(F('works__end') - F('works__start')),
-                        output_field=DurationField()
-                    )
-                )
-
-                # Aggregate the total duration across all Issues
-                total_duration = queryset.aggregate(
-                    total_duration_sum=Sum('total_duration')
-                )['total_duration_sum'] or timedelta()
-
-                # Format the total duration as a string
-                total_seconds = int(total_duration.total_seconds())
-                hours, remainder = divmod(total_seconds, 3600)
-                minutes, seconds = divmod(remainder, 60)
-                formatted_total = f"{hours}h {minutes}m"
-                
-                total_overwork = timedelta()
-                for i in queryset.all():
-                    for work in i.works.all():
-                        total_overwork += work.overwork_duration
-                    # print("work", work.start)
-
-                # Format the total overwork duration as a string
-                ow_total_seconds = int(total_overwork.total_seconds())
-                ow_hours, ow_remainder = divmod(ow_total_seconds, 3600)
-                ow_minutes, ow_seconds = divmod(ow_remainder, 60)
-                ow_formatted_total = f"{ow_hours}h {ow_minutes}m"
-                    
-                # Add the total to the template context
-                response.context_data['total'] = formatted_total
-                response.context_data['total_overwork'] = ow_formatted_total
-                p = 250 * 10 ** 3
-                response.context_data['total_value'] = f"{(math.floor(((hours + minutes / 60 ) * p) + (ow_hours + ow_minutes / 60 ) * p * 0.4)):,}"
-
+                # Add the totals to the template context
+                with instrumentation.timed('summary'), routers.reads():
+                    response.context_data.update(summary.changelist_summary(cl, self.get_changelist_totals))
+                response.context_data['summary_cache'] = summary.cache_stats()
             return response
         except:
             return response
 
 
+class IssueTitleWidget(ForeignKeyWidget):
+    """
+    ForeignKeyWidget that resolves Issue titles from a lookup table loaded
+    once per import instead of running one query per row.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(Issue, 'title', **kwargs)
+        self.issues = None
+
+    def load(self, titles):
+        """
+        Fetch every Issue referenced by `titles` in one query and create
+        the missing ones in bulk.
+        """
+        titles = {str(t).strip() for t in titles if t not in (None, '')} - {''}
+        found = {}
+        for issue in Issue.objects.filter(title__in=titles):
+            found.setdefault(issue.title, []).append(issue)
+        missing = [Issue(title=title) for title in sorted(titles - found.keys())]
+        for issue in Issue.objects.bulk_create(missing):
+            found[issue.title] = [issue]
+        # Titles shared by several Issues keep the regular lookup and its error
+        self.issues = {title: issues[0] for title, issues in found.items() if len(issues) == 1}
+
+    def clean(self, value, row=None, **kwargs):
+        if self.issues is not None and value not in (None, ''):
+            issue = self.issues.get(str(value).strip())
+            if issue is not None:
+                return issue
+        return super().clean(value, row, **kwargs)
+
+
 class WorkResource(resources.ModelResource):
     issue = fields.Field(
         column_name='issue',
         attribute='issue',
-        widget=ForeignKeyWidget(Issue, 'title')  # or another identifying field
+        widget=IssueTitleWidget()  # or another identifying field
     )
+    # Jalali wage month as YYYY-MM, derived from start and never imported
+    month = fields.Field(column_name='month', readonly=True)
     duration = fields.Field()
     overwork_duration = fields.Field()
 
     class Meta:
         model = Work
-        fields = ('issue', 'start', 'end', 'duration', 'overwork_duration')
-        export_order = ('issue', 'start', 'end', 'overwork_duration', 'duration')
+        fields = ('issue', 'month', 'start', 'end', 'duration', 'overwork_duration')
+        export_order = ('issue', 'month', 'start', 'end', 'overwork_duration', 'duration')
+        # Every row is a new Work (the file has no id column), inserted
+        # with bulk_create in one transaction for the whole file
+        force_init_instance = True
+        use_bulk = True
+        batch_size = settings.LINEAR_IMPORT_BATCH_SIZE
+        # The diff would export, and so compute overwork for, every row
+        skip_diff = True
+
+    def import_data(self, *args, **kwargs):
+        # Refresh each touched ledger day once instead of once per imported row
+        with ledger.deferred():
+            return super().import_data(*args, **kwargs)
+
+    def before_import(self, dataset, **kwargs):
+        self.touched_days = set()
+        if 'issue' in dataset.headers:
+            self.fields['issue'].widget.load(dataset['issue'])
+
+    def before_save_instance(self, instance, row, **kwargs):
+        # bulk_create does not call Work.save()
+        instance.set_work_date()
+        self.touched_days.add(ledger.work_day(instance))
+
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        # bulk_create skips the signals that keep the ledger in sync
+        if not self._is_dry_run(kwargs):
+            ledger.refresh_days(self.touched_days)
+            summary.invalidate()
+
+    def iter_queryset(self, queryset):
+        # Compute overwork a chunk at a time instead of one query per row,
+        # unless the queryset already carries the database annotation
+        if isinstance(queryset, QuerySet):
+            queryset = queryset.select_related('issue')
+        rows = super().iter_queryset(queryset)
+        if isinstance(queryset, QuerySet) and 'overwork_duration' in queryset.query.annotations:
+            yield from rows
+            return
+        while chunk := list(islice(rows, self.get_chunk_size())):
+            yield from prefetch_overwork(chunk)
+
+    def dehydrate_month(self, obj):
+        return f"{obj.jalali_year}-{obj.jalali_month:02d}"
 
     def dehydrate_duration(self, obj):
         return obj.duration
@@ -93,11 +186,100 @@ class WorkResource(resources.ModelResource):
 
 @admin.register(Work)
 class WorkAdmin(ImportExportModelAdmin):
-    list_display = ('issue', 'wage_month', 'start', 'end', 'overwork_duration', 'duration')
-    list_filter = ('wage_month',)
-    actions = [mark_as_overwork]
+    list_display = ('issue', 'month', 'start', 'end', 'overwork_duration', 'duration')
+    list_filter = (JalaliMonthListFilter, OverworkListFilter, OverlapListFilter)
+    actions = [mark_as_overwork, export_csv_in_background, export_xlsx_in_background]
     formats = [base_formats.CSV, base_formats.XLSX]
     resource_class = WorkResource
+    # Stream CSV/XLSX exports instead of building the whole dataset in memory
+    streaming_export = True
+    # Adds the totals and the calendar link around the import/export page
+    import_export_change_list_template = 'admin/linear/Work/change_list.html'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_ledger_overwork()
+
+    # Months follow start, so sorting by start sorts by month on an index
+    @admin.display(description="wage month", ordering='start')
+    def month(self, obj):
+        return obj.month_label
+
+    @admin.display(description="overwork duration", ordering='overwork_duration')
+    def overwork_duration(self, obj):
+        return obj.overwork_duration
+
+    def _do_file_export(self, file_format, request, queryset, export_form=None):
+        if not self.streaming_export or not isinstance(file_format, (base_formats.CSV, base_formats.XLSX)):
+            return super()._do_file_export(file_format, request, queryset, export_form=export_form)
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+
+        resource = self.choose_export_resource_class(export_form, request)(
+            **self.get_export_resource_kwargs(request, export_form=export_form)
+        )
+        export_fields = self.get_export_resource_fields_from_form(export_form)
+        filename = self.get_export_filename(request, queryset, file_format)
+        if isinstance(file_format, base_formats.XLSX):
+            response = FileResponse(
+                write_xlsx(resource, queryset, export_fields),
+                as_attachment=True,
+                filename=filename,
+                content_type=file_format.get_content_type(),
+            )
+        else:
+            response = StreamingHttpResponse(
+                stream_csv(resource, queryset, export_fields, encoding=self.to_encoding or 'utf-8'),
+                content_type=file_format.get_content_type(),
+            )
+            response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        post_export.send(sender=None, model=self.model)
+        return response
+
+    def get_urls(self):
+        return [
+            path('calendar/', self.admin_site.admin_view(self.calendar_view), name='linear_work_calendar'),
+            *super().get_urls(),
+        ]
+
+    def calendar_view(self, request):
+        """
+        Heatmap of hours per day and the series of the chosen bucket over
+        a date range, from the cached time-series buckets.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            kind, date_from, date_to = timeseries.parse_range(request.GET)
+        except ValueError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            kind, (date_from, date_to) = 'day', timeseries.default_range()
+        with routers.reads():
+            days = timeseries.series('day', date_from, date_to)
+            series = days if kind == 'day' else timeseries.series(kind, date_from, date_to)
+        return TemplateResponse(request, 'admin/linear/calendar.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Hours calendar",
+            'bucket': kind,
+            'buckets': list(timeseries.TRUNCATE),
+            'date_from': date_from,
+            'date_to': date_to,
+            'heatmap': timeseries.heatmap(days),
+            'series': [
+                (start, summary.summary_context(total, overwork, 0), count) for start, total, overwork, count in series
+            ],
+        })
+
+    def get_changelist_totals(self, cl):
+        """
+        Total duration, total overwork and pay of the filtered Works.
+        """
+        # Overwork is annotated by get_queryset, so the totals are one
+        # aggregate, grouped by overwork policy so each period is paid at its rates
+        totals = policy.period_totals(cl.queryset)
+        total_duration = sum((total for _, total, _ in totals), timedelta())
+        total_overwork = sum((overwork for _, _, overwork in totals), timedelta())
+        return total_duration, total_overwork, policy.pay(totals)
 
     def changelist_view(self, request, extra_context=None):
         # Call the superclass to get the default context
@@ -107,42 +289,132 @@ class WorkAdmin(ImportExportModelAdmin):
         try:
             cl = response.context_data.get('cl')
             if cl:
-               # Annotate each Issue with its total duration
-                queryset = cl.queryset.annotate(
-                    total_duration=ExpressionWrapper(
-                        Sum(F('end') - F('start')),
-                        output_field=DurationField()
-                    )
-                )
-
-                # Aggregate the total duration across all Issues
-                total_duration = queryset.aggregate(
-                    total_duration_sum=Sum('total_duration')
-                )['total_duration_sum'] or timedelta()
-
-                # Format the total duration as a string
-                total_seconds = int(total_duration.total_seconds())
-                hours, remainder = divmod(total_seconds, 3600)
-                minutes, seconds = divmod(remainder, 60)
-                formatted_total = f"{hours}h {minutes}m"
-                
-                total_overwork = timedelta()
-                for work in queryset:
-                    total_overwork += work.overwork_duration
-                    # print("work", work.start)
-
-                # Format the total overwork duration as a string
-                ow_total_seconds = int(total_overwork.total_seconds())
-                ow_hours, ow_remainder = divmod(ow_total_seconds, 3600)
-                ow_minutes, ow_seconds = divmod(ow_remainder, 60)
-                ow_formatted_total = f"{ow_hours}h {ow_minutes}m"
-                    
-                # Add the total to the template context
-                response.context_data['total'] = formatted_total
-                response.context_data['total_overwork'] = ow_formatted_total
-                p = 250 * 10 ** 3
-                response.context_data['total_value'] = f"{(math.floor(((hours + minutes / 60 ) * p) + (ow_hours + ow_minutes / 60 ) * p * 0.4)):,}"
-                            
+                # Add the totals to the template context
+                with instrumentation.timed('summary'), routers.reads():
+                    response.context_data.update(summary.changelist_summary(cl, self.get_changelist_totals))
+                response.context_data['summary_cache'] = summary.cache_stats()
             return response
         except:
-            return response
\ No newline at end of file
+            return response
+
+
+@admin.register(OverworkPolicy)
+class OverworkPolicyAdmin(admin.ModelAdmin):
+    list_display = ('valid_from', 'threshold', 'hourly_rate', 'overwork_premium')
+
+
+@admin.register(PayrollRollup)
+class PayrollRollupAdmin(admin.ModelAdmin):
+    list_display = ('month', 'issue', 'policy_from', 'regular_hours', 'overwork_hours', 'value')
+    list_filter = ('jalali_year', 'jalali_month', 'policy_from')
+    list_select_related = ('issue',)
+
+    @admin.display(description="wage month", ordering='jalali_year')
+    def month(self, obj):
+        return obj.month_label
+
+    @admin.display(description="regular hours", ordering='regular_duration')
+    def regular_hours(self, obj):
+        return round(obj.regular_duration.total_seconds() / 3600, 2)
+
+    @admin.display(description="overwork hours", ordering='overwork_duration')
+    def overwork_hours(self, obj):
+        return round(obj.overwork_duration.total_seconds() / 3600, 2)
+
+    # Rollups are maintained from Work; rebuild them with manage.py rebuild_payroll
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# How often the job list reloads while jobs are queued or running
+JOB_REFRESH_SECONDS = 5
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'status', 'created_by', 'created_at', 'finished_at', 'message', 'download')
+    list_filter = ('status', 'kind')
+    list_select_related = ('created_by',)
+    readonly_fields = ('status', 'message', 'download', 'created_by', 'created_at', 'started_at', 'finished_at')
+
+    def get_fields(self, request, obj=None):
+        # Jobs are added by picking a recompute; exports are queued from
+        # the Work and Issue admin actions
+        if obj is None:
+            return ('kind',)
+        return ('kind', 'params', *self.readonly_fields)
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return ()
+        return ('kind', 'params', *self.readonly_fields)
+
+    def formfield_for_choice_field(self, db_field, request, **kwargs):
+        if db_field.name == 'kind':
+            kwargs['choices'] = [(k, label) for k, label in Job.KINDS if k in (Job.REBUILD_LEDGER, Job.REBUILD_PAYROLL)]
+        return super().formfield_for_choice_field(db_field, request, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+    def has_change_permission(self, request, obj=None):
+        # The change page is read-only; the worker owns the job state
+        return obj is None and super().has_change_permission(request, obj)
+
+    @admin.display(description="result")
+    def download(self, obj):
+        if obj.status != Job.DONE or not obj.result:
+            return "-"
+        return format_html('<a href="{}">Download</a>', reverse('admin:linear_job_download', args=[obj.pk]))
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view), name='linear_job_download'),
+            path('<int:pk>/status/', self.admin_site.admin_view(self.status_view), name='linear_job_status'),
+            *super().get_urls(),
+        ]
+
+    def _job(self, request, pk):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            return Job.objects.get(pk=pk)
+        except Job.DoesNotExist:
+            raise Http404("No such job.")
+
+    def download_view(self, request, pk):
+        job = self._job(request, pk)
+        if job.status != Job.DONE or not job.result:
+            raise Http404("The job has no result.")
+        return FileResponse(job.result.open('rb'), as_attachment=True, filename=job.result.name.rsplit('/', 1)[-1])
+
+    def status_view(self, request, pk):
+        """
+        The job's state as JSON, for polling until it finishes.
+        """
+        job = self._job(request, pk)
+        return JsonResponse({
+            'id': job.pk,
+            'kind': job.kind,
+            'status': job.status,
+            'message': job.message,
+            'started_at': job.started_at,
+            'finished_at': job.finished_at,
+            'download': reverse('admin:linear_job_download', args=[job.pk]) if job.status == Job.DONE and job.result else None,
+        })
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {
+            **(extra_context or {}),
+            'jobs_pending': jobs.live().exists(),
+            'refresh_seconds': JOB_REFRESH_SECONDS,
+        }
+        return super().changelist_view(request, extra_context=extra_context)
@@ -0,0 +1,144 @@
+"""
+Incremental change feed of Works and Issues for downstream systems.
+
+A feed holds every row changed after a watermark plus a tombstone for
+every row deleted after it, so a nightly sync reads only the changes.
+A Work is also reported when its ledger day was recomputed, since its
+overwork may have moved with another work of the same day; overwork is
+always recomputed from the ledger. Consumers keep the returned
+watermark for the next run and apply the rows as upserts.
+
+Tombstones are kept for LINEAR_TOMBSTONE_RETENTION_DAYS and then pruned
+by `manage.py prune_tombstones`, so a consumer must sync at least that
+often: a watermark older than the retention is refused, as deletions
+after it may be gone, and the consumer has to read the full feed again.
+"""
+import csv
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .export import _Echo
+from .models import DailyLedger, Issue, Tombstone, Work
+
+FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 2000
+
+WORK_FIELDS = ('id', 'issue', 'start', 'end', 'jalali_year', 'jalali_month', 'overwork_day', 'overwork_duration', 'updated_at')
+ISSUE_FIELDS = ('id', 'title', 'total_duration', 'total_overwork', 'work_count', 'updated_at')
+MODELS = {'work': (Work, WORK_FIELDS), 'issue': (Issue, ISSUE_FIELDS)}
+
+
+def _since(since):
+    # Rows committed a little after the previous watermark may carry an
+    # earlier timestamp; read back an overlap so they are not missed
+    return since - timedelta(seconds=settings.LINEAR_CHANGE_FEED_OVERLAP)
+
+
+def changed_works(since=None):
+    works = Work.objects.all()
+    if since is not None:
+        since = _since(since)
+        recomputed = DailyLedger.objects.filter(updated_at__gt=since).values('day')
+        works = works.filter(Q(updated_at__gt=since) | Q(work_date__in=recomputed))
+    return works.with_ledger_overwork().order_by('id')
+
+
+def changed_issues(since=None):
+    issues = Issue.objects.all()
+    if since is not None:
+        issues = issues.filter(updated_at__gt=_since(since))
+    return issues.order_by('id')
+
+
+def deleted(model, since=None):
+    tombstones = Tombstone.objects.filter(model=model)
+    if since is not None:
+        tombstones = tombstones.filter(deleted_at__gt=_since(since))
+    return tombstones.order_by('deleted_at', 'id')
+
+
+def records(model, since=None):
+    """
+    Yield the feed of `model` ('work' or 'issue') since the watermark
+    `since` (everything when None): one dict per changed row with
+    op='upsert', then one per deletion with op='delete'.
+    """
+    queryset = changed_works(since) if model == 'work' else changed_issues(since)
+    fields = MODELS[model][1]
+    for row in queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+        yield {'op': 'upsert', **dict(zip(fields, row))}
+    for object_id, deleted_at in deleted(model, since).values_list('object_id', 'deleted_at').iterator(chunk_size=CHUNK_SIZE):
+        yield {'op': 'delete', 'id': object_id, 'updated_at': deleted_at}
+
+
+def retention_start():
+    """
+    The oldest watermark the feed accepts: tombstones before it may have
+    been pruned.
+    """
+    return timezone.now() - timedelta(days=settings.LINEAR_TOMBSTONE_RETENTION_DAYS)
+
+
+def parse_since(value):
+    """
+    Aware datetime of an ISO 8601 watermark, in local time when it has no
+    offset; None for an empty value. Raises ValueError, also for a
+    watermark older than the tombstone retention.
+    """
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError("since must be an ISO 8601 date and time.")
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    if since < retention_start():
+        raise ValueError(
+            f"since is older than the {settings.LINEAR_TOMBSTONE_RETENTION_DAYS} day tombstone retention, "
+            "so deletions may be missing; read the full feed again without since."
+        )
+    return since
+
+
+def prune(now=None):
+    """
+    Delete the tombstones older than the retention. Returns their number.
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=settings.LINEAR_TOMBSTONE_RETENTION_DAYS)
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
+
+
+def watermark():
+    """
+    The watermark to pass as `since` next time, taken before reading.
+    """
+    return timezone.now()
+
+
+def stream(model, since=None, format='jsonl'):
+    """
+    Generate the encoded lines of the feed: JSON Lines, or CSV with a
+    header and empty cells for the fields of deletions.
+    """
+    if format == 'jsonl':
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        for record in records(model, since):
+            yield (encoder.encode(record) + '\n').encode()
+        return
+    columns = ('op', *MODELS[model][1])
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns).encode()
+    for record in records(model, since):
+        yield writer.writerow([_csv_value(record.get(name)) for name in columns]).encode()
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
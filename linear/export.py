@@ -0,0 +1,51 @@
+import csv
+from tempfile import SpooledTemporaryFile
+
+# Exports larger than this are spooled from memory to a temporary file
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+class _Echo:
+    """
+    File-like object whose write() hands the line back to csv.writer.
+    """
+    def write(self, value):
+        return value
+
+
+def export_rows(resource, queryset, export_fields=None, **kwargs):
+    """
+    Yield the header and then one exported row per object, walking the
+    queryset a chunk at a time through `resource.iter_queryset`.
+    """
+    yield resource.get_export_headers(selected_fields=export_fields)
+    queryset = resource.filter_export(queryset, **kwargs)
+    for obj in resource.iter_queryset(queryset):
+        yield resource.export_resource(obj, selected_fields=export_fields, **kwargs)
+
+
+def stream_csv(resource, queryset, export_fields=None, encoding='utf-8'):
+    """
+    Generate CSV lines, encoded, without building the dataset in memory.
+    """
+    writer = csv.writer(_Echo())
+    for row in export_rows(resource, queryset, export_fields):
+        yield writer.writerow(row).encode(encoding)
+
+
+def write_xlsx(resource, queryset, export_fields=None):
+    """
+    Write an XLSX workbook in openpyxl's write-only mode, so rows are
+    flushed as they are appended. Returns a file positioned at the start.
+    """
+    # openpyxl (and numpy with it) is only loaded by processes that export
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in export_rows(resource, queryset, export_fields, force_native_type=True):
+        sheet.append(row)
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    workbook.save(output)
+    output.seek(0)
+    return output
@@ -0,0 +1,73 @@
+from datetime import timedelta
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from .jalali import month_label
+from .overlaps import with_overlap
+
+
+class OverworkListFilter(admin.SimpleListFilter):
+    title = "overwork"
+    parameter_name = "overwork"
+    # Relies on the overwork_duration annotation from Work.objects.with_overwork()
+    overwork_field = 'overwork_duration'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('yes', "Has overwork"),
+            ('no', "No overwork"),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(**{f'{self.overwork_field}__gt': timedelta()})
+        if self.value() == 'no':
+            return queryset.filter(**{self.overwork_field: timedelta()})
+        return queryset
+
+
+class IssueOverworkListFilter(OverworkListFilter):
+    # Issues store their total overwork
+    overwork_field = 'total_overwork'
+
+
+class OverlapListFilter(admin.SimpleListFilter):
+    title = "overlap"
+    parameter_name = "overlap"
+
+    def lookups(self, request, model_admin):
+        return (
+            ('yes', "Has overlap"),
+            ('no', "No overlap"),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return with_overlap(queryset).filter(has_overlap=True)
+        if self.value() == 'no':
+            return with_overlap(queryset).filter(has_overlap=False)
+        return queryset
+
+
+class JalaliMonthListFilter(admin.SimpleListFilter):
+    """
+    Filter on the indexed (jalali_year, jalali_month) key, offering the
+    months present in the queryset, latest first.
+    """
+    title = "wage month"
+    parameter_name = "month"
+
+    def lookups(self, request, model_admin):
+        months = (
+            model_admin.get_queryset(request).order_by().values_list('jalali_year', 'jalali_month')
+            .distinct().order_by('-jalali_year', '-jalali_month')
+        )
+        return [(f"{year}-{month:02d}", month_label(year, month)) for year, month in months]
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            year, month = map(int, self.value().split('-'))
+        except ValueError:
+            raise IncorrectLookupParameters(f"Invalid month {self.value()!r}.")
+        return queryset.filter(jalali_year=year, jalali_month=month)
@@ -0,0 +1,167 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('linear_instrumentation', default=None)
+
+
+class Recorder:
+    """
+    Collects the SQL run through the database connections and named
+    timings for one request (or one `instrument()` block).
+    """
+    def __init__(self):
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.timings = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries[sql] += 1
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicate_count(self):
+        """
+        Queries whose SQL (parameters aside) already ran in this request,
+        the usual sign of an N+1 loop.
+        """
+        return sum(count - 1 for count in self.queries.values())
+
+    def as_dict(self):
+        top_sql, top_count = self.queries.most_common(1)[0] if self.queries else ('', 0)
+        return {
+            'queries': self.query_count,
+            'db_ms': round(self.db_time * 1000, 2),
+            'duplicates': self.duplicate_count,
+            'top_duplicate': top_sql[:200] if top_count > 1 else None,
+            'timings_ms': {name: round(value * 1000, 2) for name, value in self.timings.items()},
+        }
+
+    def server_timing(self, total):
+        """
+        Value of the Server-Timing header.
+        """
+        metrics = [
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.query_count} queries, {self.duplicate_count} duplicates"',
+        ]
+        metrics += [f'{name};dur={value * 1000:.2f}' for name, value in self.timings.items()]
+        metrics.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(metrics)
+
+
+@contextmanager
+def instrument():
+    """
+    Record every query run inside the block on all database connections.
+    Yields the Recorder.
+    """
+    recorder = Recorder()
+    token = _current.set(recorder)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            yield recorder
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the time spent in the block to the current recorder under `name`.
+    Does nothing when the request is not instrumented.
+    """
+    recorder = _current.get()
+    if recorder is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.timings[name] = recorder.timings.get(name, 0.0) + time.perf_counter() - started
+
+
+class InstrumentationMiddleware:
+    """
+    Instrument a sample of requests (LINEAR_INSTRUMENTATION_SAMPLE_RATE,
+    0 to 1): add a Server-Timing header and log one JSON line with the
+    query count, database time, duplicate queries and named timings.
+    Works under WSGI and ASGI, so async views are not pushed to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with instrument() as recorder:
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        recorder = Recorder()
+        token = _current.set(recorder)
+        # The async ORM runs its queries on the request's sync thread, so
+        # the wrappers are installed on that thread's connections.
+        stack = ExitStack()
+        try:
+            await sync_to_async(self.wrap_connections)(stack, recorder)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _current.reset(token)
+        return self.finish(request, response, recorder, time.perf_counter() - started)
+
+    @staticmethod
+    def sampled():
+        sample_rate = settings.LINEAR_INSTRUMENTATION_SAMPLE_RATE
+        return sample_rate > 0 and random.random() < sample_rate
+
+    @staticmethod
+    def wrap_connections(stack, recorder):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+
+    def finish(self, request, response, recorder, total):
+        response['Server-Timing'] = recorder.server_timing(total)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            **recorder.as_dict(),
+        }
+        logger.info(json.dumps(record, ensure_ascii=False), extra={'instrumentation': record})
+        return response
@@ -0,0 +1,107 @@
+"""
+Gregorian to Jalali (Solar Hijri) date conversion.
+
+The Gregorian date of Nowruz (1 Farvardin) is computed once for every
+supported year with the 33-year cycle breaks of the arithmetic calendar
+(as in jalaali-js), and a conversion is then a binary search in that
+table plus a division for the month.
+"""
+from bisect import bisect_right
+from datetime import date
+
+FIRST_YEAR = 1200
+LAST_YEAR = 1600
+
+MONTH_NAMES = (
+    'فروردین', 'اردیبهشت', 'خرداد', 'تیر', 'مرداد', 'شهریور',
+    'مهر', 'آبان', 'آذر', 'دی', 'بهمن', 'اسفند',
+)
+
+# Jalali years where the leap-year cycle restarts
+BREAKS = (-61, 9, 38, 199, 426, 686, 756, 818, 1111, 1181, 1210, 1635, 2060, 2097, 2192, 2262, 2324, 2394, 2456, 3178)
+
+
+def _div(a, b):
+    # Integer division truncating towards zero, as in the reference algorithm
+    return int(a / b)
+
+
+def _mod(a, b):
+    return a - _div(a, b) * b
+
+
+def nowruz(year):
+    """
+    Gregorian date of 1 Farvardin of the Jalali `year`.
+    """
+    if not BREAKS[0] <= year < BREAKS[-1]:
+        raise ValueError(f"Jalali year {year} is out of range.")
+    leap_j = -14
+    jp = BREAKS[0]
+    for jm in BREAKS[1:]:
+        jump = jm - jp
+        if year < jm:
+            break
+        leap_j += _div(jump, 33) * 8 + _div(_mod(jump, 33), 4)
+        jp = jm
+    n = year - jp
+    leap_j += _div(n, 33) * 8 + _div(_mod(n, 33) + 3, 4)
+    if _mod(jump, 33) == 4 and jump - n == 4:
+        leap_j += 1
+    gregorian_year = year + 621
+    leap_g = _div(gregorian_year, 4) - _div((_div(gregorian_year, 100) + 1) * 3, 4) - 150
+    return date(gregorian_year, 3, 20 + leap_j - leap_g)
+
+
+# Ordinal of each Nowruz from FIRST_YEAR to LAST_YEAR + 1
+NOWRUZ = [nowruz(year).toordinal() for year in range(FIRST_YEAR, LAST_YEAR + 2)]
+
+
+def from_gregorian(day):
+    """
+    (year, month, day) of the Jalali date of the Gregorian date `day`.
+    """
+    ordinal = day.toordinal()
+    index = bisect_right(NOWRUZ, ordinal) - 1
+    if index < 0 or index > LAST_YEAR - FIRST_YEAR:
+        raise ValueError(f"{day} is out of the supported range.")
+    day_of_year = ordinal - NOWRUZ[index]
+    # Six months of 31 days, five of 30 and Esfand with 29 or 30
+    if day_of_year < 186:
+        month, month_day = divmod(day_of_year, 31)
+    else:
+        month, month_day = divmod(day_of_year - 186, 30)
+        month += 6
+    return FIRST_YEAR + index, month + 1, month_day + 1
+
+
+def to_gregorian(year, month, day=1):
+    """
+    Gregorian date of a Jalali date.
+    """
+    if not FIRST_YEAR <= year <= LAST_YEAR:
+        raise ValueError(f"Jalali year {year} is out of the supported range.")
+    offset = (month - 1) * 31 if month <= 7 else 186 + (month - 7) * 30
+    return date.fromordinal(NOWRUZ[year - FIRST_YEAR] + offset + day - 1)
+
+
+def is_leap(year):
+    return NOWRUZ[year - FIRST_YEAR + 1] - NOWRUZ[year - FIRST_YEAR] == 366
+
+
+def month_name(month):
+    return MONTH_NAMES[month - 1]
+
+
+def month_label(year, month):
+    """
+    "1404 فروردین" style label of a Jalali month.
+    """
+    return f"{year} {month_name(month)}"
+
+
+def month_number(name):
+    """
+    Month number of a Persian month name. Raises ValueError.
+    """
+    return MONTH_NAMES.index(name) + 1
@@ -0,0 +1,224 @@
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+from django.conf import settings
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth.models import AnonymousUser
+from django.core.files import File
+from django.db import DatabaseError, connections
+from django.db.models import F, Q
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+from .export import SPOOL_MAX_SIZE, stream_csv, write_xlsx
+from .models import Issue, Job, Work
+from . import ledger, payroll, summary, totals
+
+logger = logging.getLogger(__name__)
+
+# Queued jobs looked at per claim attempt
+CLAIM_BATCH = 10
+
+_handlers = {}
+
+
+def handler(kind):
+    """
+    Register the function that runs jobs of `kind`. It receives the Job
+    and returns the message stored on it.
+    """
+    def register(function):
+        _handlers[kind] = function
+        return function
+    return register
+
+
+def enqueue(kind, user=None, **params):
+    """
+    Queue a job; `params` must be JSON serializable.
+    """
+    return Job.objects.create(kind=kind, params=params, created_by=user)
+
+
+def selection(request):
+    """
+    Parameters of the admin selection an action was run on: the
+    changelist filters and, unless every matching row was selected, the
+    selected ids. The worker rebuilds the queryset from them.
+    """
+    select_across = request.POST.get('select_across') == '1'
+    return {
+        'filters': request.GET.urlencode(),
+        'ids': None if select_across else request.POST.getlist(ACTION_CHECKBOX_NAME),
+    }
+
+
+def lease_expiry():
+    return timezone.now() - timedelta(seconds=settings.LINEAR_JOB_LEASE_SECONDS)
+
+
+def live():
+    """
+    The jobs still waiting for or held by a worker.
+    """
+    return Job.objects.filter(Q(status=Job.QUEUED) | Q(status=Job.RUNNING, heartbeat_at__gte=lease_expiry()))
+
+
+def reclaim():
+    """
+    Requeue the running jobs whose worker stopped renewing their lease,
+    as after a crash or kill, and fail those started too many times.
+    Returns the number requeued.
+    """
+    expired = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=lease_expiry())
+    failed = expired.filter(attempts__gte=settings.LINEAR_JOB_MAX_ATTEMPTS).update(
+        status=Job.FAILED, message="The worker running the job was lost too many times.", finished_at=timezone.now(),
+    )
+    if failed:
+        logger.warning("Failed %s jobs whose workers were lost", failed)
+    requeued = expired.update(status=Job.QUEUED, heartbeat_at=None)
+    if requeued:
+        logger.warning("Requeued %s jobs whose workers were lost", requeued)
+    return requeued
+
+
+def claim():
+    """
+    Mark the oldest queued job as running and return its id, or None when
+    the queue is empty. The conditional UPDATE lets several workers poll
+    the same table without running a job twice. Expired leases are
+    reclaimed first.
+    """
+    reclaim()
+    candidates = Job.objects.filter(status=Job.QUEUED).order_by('id').values_list('id', flat=True)[:CLAIM_BATCH]
+    for pk in candidates:
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return pk
+    return None
+
+
+def finish(pk, status, message, attempt=None):
+    """
+    Record the outcome of a job. With `attempt`, only while that attempt
+    still holds the job, so a worker whose lease expired cannot overwrite
+    the outcome of the next one.
+    """
+    jobs = Job.objects.filter(pk=pk)
+    if attempt is not None:
+        jobs = jobs.filter(status=Job.RUNNING, attempts=attempt)
+    jobs.update(status=status, message=message, finished_at=timezone.now())
+
+
+@contextmanager
+def heartbeat(job):
+    """
+    Renew the lease of a running job from a background thread until the
+    block exits.
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.LINEAR_JOB_LEASE_SECONDS / 3):
+                try:
+                    Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts).update(
+                        heartbeat_at=timezone.now(),
+                    )
+                except DatabaseError:
+                    # A busy database is retried on the next beat, well within the lease
+                    logger.warning("Heartbeat of job %s failed", job.pk, exc_info=True)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f"job-{job.pk}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run(pk):
+    """
+    Run a claimed job and record its outcome. Returns the final status.
+    """
+    job = Job.objects.get(pk=pk)
+    try:
+        with heartbeat(job):
+            message = _handlers[job.kind](job)
+    except Exception as e:
+        logger.exception("Job %s failed", pk)
+        finish(pk, Job.FAILED, f"{type(e).__name__}: {e}", job.attempts)
+        return Job.FAILED
+    finish(pk, Job.DONE, message or "", job.attempts)
+    return Job.DONE
+
+
+def job_queryset(job, model):
+    """
+    The admin selection an export was queued from, rebuilt by running the
+    changelist of `model` with the stored filters as the user who queued
+    it, then narrowed to the selected ids.
+    """
+    from django.contrib import admin
+
+    request = HttpRequest()
+    request.method = 'GET'
+    request.GET = QueryDict(job.params.get('filters', ''))
+    request.user = job.created_by or AnonymousUser()
+    model_admin = admin.site.get_model_admin(model)
+    queryset = model_admin.get_changelist_instance(request).get_queryset(request)
+    if job.params.get('ids') is not None:
+        queryset = queryset.filter(pk__in=job.params['ids'])
+    return queryset
+
+
+def export(job, resource, queryset):
+    if job.params.get('format') == 'xlsx':
+        output, extension = write_xlsx(resource, queryset), 'xlsx'
+    else:
+        output, extension = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE), 'csv'
+        for line in stream_csv(resource, queryset):
+            output.write(line)
+        output.seek(0)
+    with output:
+        job.result.save(f"{job.kind}-{job.pk}.{extension}", File(output), save=False)
+    Job.objects.filter(pk=job.pk).update(result=job.result.name)
+    return f"Exported to {job.result.name}."
+
+
+@handler(Job.EXPORT_WORKS)
+def export_works(job):
+    from .admin import WorkResource
+
+    return export(job, WorkResource(), job_queryset(job, Work))
+
+
+@handler(Job.EXPORT_ISSUES)
+def export_issues(job):
+    from .admin import IssueResource
+
+    return export(job, IssueResource(), job_queryset(job, Issue))
+
+
+@handler(Job.REBUILD_LEDGER)
+def rebuild_ledger(job):
+    rows = ledger.rebuild()
+    # The rollups read overwork from the ledger
+    rollups = payroll.rebuild()
+    issues = totals.rebuild()
+    summary.invalidate()
+    return f"Rebuilt {rows} ledger days, {rollups} payroll rollups and the totals of {issues} issues."
+
+
+@handler(Job.REBUILD_PAYROLL)
+def rebuild_payroll(job):
+    rollups = payroll.rebuild()
+    summary.invalidate()
+    return f"Rebuilt {rollups} payroll rollups."
@@ -0,0 +1,112 @@
+import threading
+from contextlib import contextmanager
+from django.db import transaction
+from django.utils import timezone
+from .models import DailyLedger, Work
+from .overwork import summarize_days
+from .sqlite import chunked
+from . import payroll, timeseries
+
+_state = threading.local()
+
+
+def work_day(work):
+    """
+    The ledger day a Work belongs to: its local start date.
+    """
+    return timezone.localtime(work.start).date()
+
+
+def refresh_days(days):
+    """
+    Recompute the ledger rows of `days` from the works currently stored.
+    Inside `deferred()` the days are only collected and refreshed once
+    when the block exits.
+    """
+    days = set(days)
+    if not days:
+        return
+    pending = getattr(_state, 'pending', None)
+    if pending is not None:
+        pending.update(days)
+        return
+    days = sorted(days)
+    with transaction.atomic():
+        for chunk in chunked(days):
+            works = Work.objects.filter(work_date__in=chunk).only('id', 'start', 'end', 'work_date', 'overwork_day')
+            _store(DailyLedger.objects.filter(day__in=chunk), summarize_days(works))
+            # The overwork of every work on these days may have moved
+            payroll.refresh(days=chunk)
+        timeseries.invalidate(days)
+
+
+def _store(current, rows):
+    """
+    Upsert the ledger `rows` and delete the rows of `current` that are no
+    longer among them. Unlike a delete and insert, two refreshes of the
+    same day at once cannot both insert it. Returns the number of rows.
+    """
+    rows = [DailyLedger(**row) for row in rows]
+    DailyLedger.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True, unique_fields=['day', 'end_day'],
+        update_fields=['total_duration', 'nine_hour_mark', 'overwork', 'work_count', 'updated_at'],
+    )
+    keys = {(row.day, row.end_day) for row in rows}
+    stale = [pk for pk, *key in current.values_list('pk', 'day', 'end_day').iterator() if tuple(key) not in keys]
+    for chunk in chunked(stale):
+        DailyLedger.objects.filter(pk__in=chunk).delete()
+    return len(rows)
+
+
+def refresh_works(works):
+    """
+    Recompute the ledger days touched by `works`.
+    """
+    refresh_days(work_day(w) for w in works)
+
+
+@contextmanager
+def deferred():
+    """
+    Collect the days touched inside the block and refresh each of them
+    once at the end, instead of once per saved row.
+    """
+    if getattr(_state, 'pending', None) is not None:
+        yield
+        return
+    _state.pending = set()
+    try:
+        yield
+    finally:
+        days, _state.pending = _state.pending, None
+        refresh_days(days)
+
+
+def rebuild():
+    """
+    Drop and recompute the whole ledger. Returns the number of rows written.
+    """
+    works = Work.objects.only('id', 'start', 'end', 'work_date', 'overwork_day').iterator(chunk_size=2000)
+    with transaction.atomic():
+        rows = _store(DailyLedger.objects.all(), summarize_days(works))
+        timeseries.clear()
+    return rows
+
+
+def check():
+    """
+    Compare the stored ledger with a live computation from Work.
+    Returns a list of (day, end_day, field, stored, live) differences.
+    """
+    works = Work.objects.only('id', 'start', 'end', 'work_date', 'overwork_day').iterator(chunk_size=2000)
+    live = {(row['day'], row['end_day']): row for row in summarize_days(works)}
+    stored = {(row['day'], row['end_day']): row for row in DailyLedger.objects.values()}
+    fields = ('total_duration', 'nine_hour_mark', 'overwork', 'work_count')
+    differences = []
+    for key in sorted(live.keys() | stored.keys()):
+        for field in fields:
+            stored_value = stored[key][field] if key in stored else None
+            live_value = live[key][field] if key in live else None
+            if stored_value != live_value:
+                differences.append((*key, field, stored_value, live_value))
+    return differences
@@ -0,0 +1,64 @@
+import json
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def timings(samples):
+    samples = sorted(samples)
+    return {
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+    }
+
+
+def query(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a simple query on a new connection per request against a kept "
+        "connection. With DATABASE_POOL on, new connections come from the pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Queries timed per mode.")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        alias, count = options['database'], options['requests']
+        pooled = bool(connections.settings[alias].get('OPTIONS', {}).get('pool'))
+
+        per_request = []
+        for _ in range(count):
+            # What every request pays with CONN_MAX_AGE=0
+            connection = connections.create_connection(alias)
+            started = time.perf_counter()
+            query(connection)
+            per_request.append(time.perf_counter() - started)
+            connection.close()
+
+        kept = []
+        connection = connections.create_connection(alias)
+        query(connection)
+        for _ in range(count):
+            started = time.perf_counter()
+            query(connection)
+            kept.append(time.perf_counter() - started)
+        connection.close()
+
+        self.stdout.write(json.dumps({
+            'database': connections.settings[alias]['ENGINE'],
+            'requests': count,
+            'pooled': pooled,
+            'results': [
+                # New connections come from the pool when it is on
+                {'mode': 'new_connection', **timings(per_request)},
+                {'mode': 'persistent', **timings(kept)},
+            ],
+        }, indent=2))
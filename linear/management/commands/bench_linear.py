@@ -0,0 +1,119 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from django.contrib.auth.models import User
+from django.contrib.admin.sites import site
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from linear.admin import WorkResource
+from linear.export import stream_csv
+from linear.models import Issue, Work
+from linear.overwork import prefetch_overwork
+from linear import analytics, summary, synthetic
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def measure(results, name):
+    """
+    Record wall time, query count and peak Python memory of the block.
+    """
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        yield
+        wall_time = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results[name] = {
+        'wall_time': round(wall_time, 4),
+        'queries': len(queries),
+        'peak_memory': peak,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark overwork, changelist totals, Issue durations and export on "
+        "synthetic data. Everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+            help="Numbers of Works to generate, one run per size.",
+        )
+        parser.add_argument(
+            '--per-row-limit', type=int, default=1000,
+            help="Works timed through the per-row overwork_duration property.",
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        report = {'database': connection.vendor, 'sizes': {}}
+        for size in options['sizes']:
+            report['sizes'][str(size)] = self.run(size, options)
+            self.stderr.write(f"{size} works done")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run(self, size, options):
+        results = {}
+        try:
+            with transaction.atomic():
+                synthetic.generate(size, seed=options['seed'])
+                self.bench(results, options)
+                raise Rollback
+        except Rollback:
+            pass
+        return results
+
+    def bench(self, results, options):
+        user = User.objects.create_superuser('bench_linear', 'bench@example.com', None)
+        factory = RequestFactory()
+
+        works = list(Work.objects.all()[:options['per_row_limit']])
+        with measure(results, 'overwork_property'):
+            [w.overwork_duration for w in works]
+        results['overwork_property']['rows'] = len(works)
+
+        with measure(results, 'overwork_batch'):
+            prefetch_overwork(Work.objects.all())
+
+        with measure(results, 'analytics_load'):
+            arrays = analytics.load()
+        with measure(results, 'analytics_compute'):
+            analytics.daily_totals(arrays)
+            analytics.payroll(arrays)
+
+        for model in (Work, Issue):
+            request = factory.get(f'/admin/linear/{model._meta.model_name}/')
+            request.user = user
+            model_admin = site._registry[model]
+            summary.invalidate()
+            with measure(results, f'{model._meta.model_name}_changelist'):
+                model_admin.changelist_view(request).render()
+            with measure(results, f'{model._meta.model_name}_changelist_cached'):
+                model_admin.changelist_view(request).render()
+
+        with measure(results, 'issue_duration'):
+            [issue.duration() for issue in Issue.objects.all()]
+
+        with measure(results, 'export_dataset'):
+            WorkResource().export(Work.objects.all())
+
+        with measure(results, 'export_csv_stream'):
+            for _ in stream_csv(WorkResource(), Work.objects.with_ledger_overwork()):
+                pass
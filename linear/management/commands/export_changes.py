@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from linear import changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the Works or Issues changed or deleted since a watermark as "
+        "CSV or JSON Lines. The watermark for the next run is printed to "
+        "stderr; run again within LINEAR_TOMBSTONE_RETENTION_DAYS, as older "
+        "watermarks are refused."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Watermark of the previous run (ISO 8601); everything when omitted.")
+        parser.add_argument('--model', choices=tuple(changes.MODELS), default='work')
+        parser.add_argument('--format', choices=changes.FORMATS, default='jsonl')
+        parser.add_argument('--output', help="File to write to instead of stdout.")
+
+    def handle(self, *args, **options):
+        try:
+            since = changes.parse_since(options['since'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        watermark = changes.watermark()
+        lines = changes.stream(options['model'], since, options['format'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line.decode(), ending='')
+        self.stderr.write(f"watermark {watermark.isoformat()}")
@@ -0,0 +1,200 @@
+import json
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.test import Client, override_settings
+from django.utils.crypto import get_random_string
+from linear.models import Work
+from linear import signals, synthetic
+
+# Query count in the Server-Timing header of linear.instrumentation
+QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries')
+
+
+def percentile(samples, fraction):
+    """
+    Nearest-rank percentile of sorted `samples`.
+    """
+    return samples[min(len(samples) - 1, max(0, round(fraction * len(samples)) - 1))]
+
+
+def summarize(results, wall_time):
+    latencies = sorted(latency for latency, _, _ in results)
+    queries = [count for _, _, count in results if count is not None]
+    return {
+        'requests': len(results),
+        # A redirect here is the login page, so only 200 counts as success
+        'errors': sum(1 for _, status, _ in results if status != 200),
+        'throughput_rps': round(len(results) / wall_time, 2) if wall_time else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+        'queries_mean': round(sum(queries) / len(queries), 1) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+class InProcess:
+    """
+    Sends requests through the full middleware stack with one test Client
+    per thread, against the configured database.
+    """
+    def __init__(self, cookies):
+        self.cookies = cookies
+        self.local = threading.local()
+
+    def request(self, method, path, data=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client()
+            for name, value in self.cookies.items():
+                client.cookies[name] = value
+        response = client.generic(method, path, urllib.parse.urlencode(data or {}),
+                                  'application/x-www-form-urlencoded')
+        # Streamed exports do their work while being read
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, response.get('Server-Timing', ''), len(body)
+
+    def close(self):
+        connections.close_all()
+
+
+class Remote:
+    """
+    Sends requests over HTTP to a running server sharing this database.
+    """
+    def __init__(self, url, cookies):
+        self.url = url.rstrip('/')
+        self.headers = {
+            'Cookie': '; '.join(f'{name}={value}' for name, value in cookies.items()),
+            'X-CSRFToken': cookies[settings.CSRF_COOKIE_NAME],
+            'Referer': self.url + '/',
+        }
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data else None
+        request = urllib.request.Request(self.url + path, body, self.headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.headers.get('Server-Timing', ''), len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Server-Timing', ''), len(e.read())
+
+    def close(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the Work and Issue changelists, their filters and the "
+        "export endpoints with concurrent requests from a thread pool, and "
+        "report p50/p95/p99 latency, throughput and queries per endpoint. "
+        "Runs in process by default; --url targets a running server, which "
+        "must share this database and have LINEAR_INSTRUMENTATION_SAMPLE_RATE=1 "
+        "for query counts. Seeded data and the test user are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Base URL of a running server, such as http://127.0.0.1:8000.")
+        parser.add_argument('--works', type=int, default=2000, help="Synthetic Works to seed; 0 uses the existing data.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Threads sending requests.")
+        parser.add_argument('--requests', type=int, default=50, help="Requests per endpoint.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded data.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError("--concurrency and --requests must be positive.")
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_superuser(f'loadtest-{tag}', f'{tag}@example.com', None)
+        created = synthetic.generate(options['works'], seed=options['seed']) if options['works'] else []
+        try:
+            report = self.run(user, created, options)
+        finally:
+            user.delete()
+            if created and not options['keep']:
+                self.clean_up(created)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run(self, user, created, options):
+        client = Client()
+        client.force_login(user)
+        cookies = {
+            settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value,
+            settings.CSRF_COOKIE_NAME: get_random_string(CSRF_SECRET_LENGTH, CSRF_ALLOWED_CHARS),
+        }
+        transport = Remote(options['url'], cookies) if options['url'] else InProcess(cookies)
+        report = {'target': options['url'] or 'in-process', 'database': connections['default'].vendor,
+                  'works': Work.objects.count(), 'concurrency': options['concurrency'], 'endpoints': {}}
+        # The in-process server reports the queries of every request
+        with override_settings(LINEAR_INSTRUMENTATION_SAMPLE_RATE=1):
+            for name, method, path, data in self.endpoints(created):
+                report['endpoints'][name] = self.load(transport, method, path, data, options)
+                self.stderr.write(f"{name} done")
+        return report
+
+    def endpoints(self, created):
+        sample = created[0] if created else Work.objects.order_by('-start').first()
+        month = f"{sample.jalali_year}-{sample.jalali_month:02d}" if sample else ''
+        work_fields = {f'workresource_{field}': 'on' for field in ('issue', 'start', 'end', 'overwork_duration')}
+        issue_fields = {f'issueresource_{field}': 'on' for field in ('title', 'total_duration', 'total_overwork')}
+        return [
+            ('work_changelist', 'GET', '/admin/linear/work/', None),
+            ('work_changelist_filtered', 'GET', f'/admin/linear/work/?month={month}&overwork=yes', None),
+            ('issue_changelist', 'GET', '/admin/linear/issue/', None),
+            ('issue_changelist_filtered', 'GET', '/admin/linear/issue/?overwork=yes&o=-2', None),
+            ('work_export_csv', 'POST', '/admin/linear/work/export/', {'format': '0', 'resource': '0', **work_fields}),
+            ('issue_export_csv', 'POST', '/admin/linear/issue/export/', {'format': '0', 'resource': '0', **issue_fields}),
+            ('api_works', 'GET', '/linear/api/works/?limit=500', None),
+            ('api_changes', 'GET', '/linear/api/changes/?model=issue', None),
+        ]
+
+    def load(self, transport, method, path, data, options):
+        def send(_):
+            started = time.perf_counter()
+            try:
+                status, server_timing, _ = transport.request(method, path, data)
+            except Exception as e:
+                self.stderr.write(f"{path}: {type(e).__name__}: {e}")
+                status, server_timing = 0, ''
+            latency = time.perf_counter() - started
+            queries = QUERIES.search(server_timing)
+            return latency, status, int(queries.group(1)) if queries else None
+
+        def worker(numbers):
+            try:
+                return [send(number) for number in numbers]
+            finally:
+                transport.close()
+
+        # Split the requests over the threads so each keeps its client
+        threads = options['concurrency']
+        shares = [range(i, options['requests'], threads) for i in range(threads)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            results = [result for share in pool.map(worker, shares) for result in share]
+        return summarize(results, time.perf_counter() - started)
+
+    def clean_up(self, created):
+        # synthetic.generate files the seeded Works under Issues it creates
+        # for them, so everything under those Issues goes, without
+        # Tombstones the change feed would report as deletions of real rows
+        signals.delete_issues(work.issue_id for work in created)
@@ -0,0 +1,111 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What each kind of process loads before doing any work
+SCENARIOS = {
+    'setup': "import django; django.setup()",
+    'worker': "import django; django.setup(); from linear import jobs",
+    'web': (
+        "from django.core.wsgi import get_wsgi_application; get_wsgi_application(); "
+        "from django.urls import get_resolver; get_resolver().url_patterns"
+    ),
+}
+PROFILES = {'default': '0', 'production': '1'}
+
+# Run in the child after the scenario: its wall time and, on Linux, its
+# resident and peak resident memory. getrusage() is not used as a child
+# inherits the peak of the process that started it.
+REPORT = """
+import json, time
+memory = {}
+try:
+    with open('/proc/self/status') as status:
+        memory = {line.split(':')[0]: int(line.split()[1]) for line in status if line.startswith(('VmRSS', 'VmHWM'))}
+except OSError:
+    pass
+print(json.dumps({'seconds': time.perf_counter() - started, 'rss_kb': memory.get('VmRSS'), 'peak_rss_kb': memory.get('VmHWM')}))
+"""
+
+
+def parse_importtime(output):
+    """
+    {top-level module: cumulative microseconds} from `python -X importtime`
+    output; nested imports are indented under the module importing them.
+    """
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            modules[name.strip()] = modules.get(name.strip(), 0) + int(cumulative)
+    return modules
+
+
+def median(values):
+    values = [value for value in values if value is not None]
+    return statistics.median(values) if values else None
+
+
+def run(scenario, profile):
+    code = f"import time; started = time.perf_counter()\n{SCENARIOS[scenario]}\n{REPORT}"
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'WorkDjango.settings'),
+        'LINEAR_PRODUCTION_PROFILE': PROFILES[profile],
+    }
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if process.returncode:
+        raise CommandError(f"{scenario}/{profile} failed:\n{process.stderr[-2000:]}")
+    return json.loads(process.stdout.splitlines()[-1]), parse_importtime(process.stderr)
+
+
+class Command(BaseCommand):
+    help = (
+        "Start fresh Python processes the way a worker, a web server or a "
+        "bare django.setup() does, with and without the production profile, "
+        "and report the wall time, `python -X importtime` cost by top-level "
+        "module and resident memory of each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=tuple(SCENARIOS), default=list(SCENARIOS))
+        parser.add_argument('--profiles', nargs='+', choices=tuple(PROFILES), default=list(PROFILES))
+        parser.add_argument('--repeat', type=int, default=3, help="Processes per measurement; medians are reported.")
+        parser.add_argument('--top', type=int, default=10, help="Slowest top-level imports to list.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be positive.")
+        report = {'python': sys.version.split()[0], 'results': {}}
+        for profile in options['profiles']:
+            for scenario in options['scenarios']:
+                runs = [run(scenario, profile) for _ in range(options['repeat'])]
+                imports = runs[-1][1]
+                report['results'][f'{scenario}/{profile}'] = {
+                    'wall_ms': round(statistics.median(r['seconds'] for r, _ in runs) * 1000, 1),
+                    'import_ms': round(statistics.median(sum(i.values()) for _, i in runs) / 1000, 1),
+                    'rss_kb': median(r['rss_kb'] for r, _ in runs),
+                    'peak_rss_kb': median(r['peak_rss_kb'] for r, _ in runs),
+                    'top_imports_ms': {
+                        name: round(micros / 1000, 1)
+                        for name, micros in sorted(imports.items(), key=lambda item: -item[1])[:options['top']]
+                    },
+                }
+                self.stderr.write(f"{scenario}/{profile} done")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from linear import changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the change feed tombstones older than "
+        "LINEAR_TOMBSTONE_RETENTION_DAYS. Run it daily, for example from cron."
+    )
+
+    def handle(self, *args, **options):
+        deleted = changes.prune()
+        self.stdout.write(
+            f"Pruned {deleted} tombstones older than {settings.LINEAR_TOMBSTONE_RETENTION_DAYS} days."
+        )
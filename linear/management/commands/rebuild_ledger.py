@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from linear import ledger
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-day work ledger, or check it against a live computation."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only compare the stored ledger with the live computation.",
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rows = ledger.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} ledger days."))
+
+        differences = ledger.check()
+        for day, end_day, field, stored, live in differences:
+            self.stdout.write(f"{day} -> {end_day}: {field} stored={stored} live={live}")
+        if differences:
+            raise CommandError(f"{len(differences)} ledger differences found.")
+        self.stdout.write(self.style.SUCCESS("Ledger matches the live computation."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from linear import payroll
+from linear.jalali import month_label
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the monthly payroll rollups, or check them against a live "
+        "computation. Reads overwork from the ledger, so rebuild that first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only compare the stored rollups with the live computation.",
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rows = payroll.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} payroll rollups."))
+
+        differences = payroll.check()
+        for year, month, issue, policy_from, field, stored, live in differences:
+            period = f" / policy from {policy_from}" if policy_from else ""
+            self.stdout.write(f"{month_label(year, month)} / issue {issue}{period}: {field} stored={stored} live={live}")
+        if differences:
+            raise CommandError(f"{len(differences)} payroll differences found.")
+        self.stdout.write(self.style.SUCCESS("Payroll rollups match the live computation."))
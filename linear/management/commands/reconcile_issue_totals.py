@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from linear import totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Repair the stored duration, overwork and work count of every Issue, "
+        "or check them against a live computation. Reads overwork from the "
+        "ledger, so rebuild that first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only compare the stored totals with the live computation.",
+        )
+
+    def handle(self, *args, **options):
+        differences = totals.check()
+        for issue, field, stored, live in differences:
+            self.stdout.write(f"issue {issue}: {field} stored={stored} live={live}")
+        if options['check']:
+            if differences:
+                raise CommandError(f"{len(differences)} issue total differences found.")
+            self.stdout.write(self.style.SUCCESS("Issue totals match the live computation."))
+            return
+
+        drifted = {issue for issue, *_ in differences}
+        totals.refresh(drifted)
+        self.stdout.write(self.style.SUCCESS(f"Repaired the totals of {len(drifted)} issues."))
@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+# Spawned children import this module before Django is set up, so the
+# functions they run import the app lazily
+
+
+def setup_worker():
+    import django
+
+    django.setup()
+
+
+def run_job(pk):
+    from linear import jobs
+
+    return jobs.run(pk)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued linear jobs (background exports and recomputes) in a pool "
+        "of worker processes, polling the job table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1,
+            help="Worker processes; 0 runs the jobs in this process.",
+        )
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds between polls of an idle queue.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        if options['processes'] == 0:
+            self.run_inline(options)
+        else:
+            self.run_pool(options)
+
+    def report(self, pk, status):
+        from linear.models import Job
+
+        style = self.style.SUCCESS if status == Job.DONE else self.style.ERROR
+        self.stdout.write(style(f"job {pk} {status}"))
+
+    def run_inline(self, options):
+        from linear import jobs
+
+        while True:
+            pk = jobs.claim()
+            if pk is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            self.report(pk, jobs.run(pk))
+
+    def pool(self, options):
+        # Spawned children set Django up afresh instead of inheriting the
+        # parent's database connections
+        connections.close_all()
+        return ProcessPoolExecutor(
+            max_workers=options['processes'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=setup_worker,
+        )
+
+    def run_pool(self, options):
+        from linear import jobs
+        from linear.models import Job
+
+        pool = self.pool(options)
+        running = {}
+        broken = False
+        try:
+            while True:
+                while not broken and len(running) < options['processes'] and (pk := jobs.claim()) is not None:
+                    try:
+                        running[pool.submit(run_job, pk)] = pk
+                    except BrokenProcessPool as e:
+                        jobs.finish(pk, Job.FAILED, f"{type(e).__name__}: {e}")
+                        self.report(pk, Job.FAILED)
+                        broken = True
+                if not running:
+                    if broken:
+                        # A child died; start over with a fresh pool
+                        pool.shutdown(wait=False)
+                        pool, broken = self.pool(options), False
+                        continue
+                    if options['once']:
+                        return
+                    time.sleep(options['poll'])
+                    continue
+                done, _ = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    pk = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        # The child died before it could record the outcome
+                        jobs.finish(pk, Job.FAILED, f"{type(e).__name__}: {e}")
+                        status = Job.FAILED
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                    self.report(pk, status)
+        finally:
+            pool.shutdown()
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+from linear import overlaps
+
+
+class Command(BaseCommand):
+    help = "Report every Work whose interval overlaps an earlier Work, in one sorted pass."
+
+    def handle(self, *args, **options):
+        found = overlaps.scan()
+        for pk, other, overlap in found:
+            self.stdout.write(f"work {pk} overlaps work {other} by {overlap}")
+        if found:
+            raise CommandError(f"{len(found)} overlapping works found.")
+        self.stdout.write(self.style.SUCCESS("No overlapping works."))
@@ -0,0 +1,115 @@
+import json
+import statistics
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from django.contrib.admin.sites import site
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import RequestFactory
+from tablib import Dataset
+from linear.admin import WorkResource
+from linear.models import Issue, Work
+from linear import signals, sqlite
+
+
+def latencies(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'p50_ms': round(samples[len(samples) // 2] * 1000, 2),
+        'max_ms': round(samples[-1] * 1000, 2),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Run imports and Work/Issue changelist reports at the same time from "
+        "several threads and report latencies and errors. Everything the run "
+        "creates is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--importers', type=int, default=2, help="Threads importing Works.")
+        parser.add_argument('--readers', type=int, default=4, help="Threads rendering changelists.")
+        parser.add_argument('--rounds', type=int, default=5, help="Imports or reports per thread.")
+        parser.add_argument('--rows', type=int, default=100, help="Works per import.")
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        user = User.objects.create_superuser(f'concurrency-{tag}', f'{tag}@example.com', None)
+        results = {'imports': [], 'reports': [], 'errors': []}
+        lock = threading.Lock()
+
+        def record(kind, started):
+            with lock:
+                results[kind].append(time.perf_counter() - started)
+
+        def fail(error):
+            with lock:
+                results['errors'].append(f"{type(error).__name__}: {error}")
+
+        def importer(number):
+            try:
+                for round_ in range(options['rounds']):
+                    data = Dataset(headers=['issue', 'start', 'end'])
+                    base = datetime(2030, 1, 1) + timedelta(days=1000 * number + 50 * round_)
+                    for i in range(options['rows']):
+                        start = base + timedelta(hours=3 * i)
+                        data.append([f"concurrency-{tag}-{number}", start, start + timedelta(hours=2)])
+                    started = time.perf_counter()
+                    result = WorkResource().import_data(data)
+                    if result.has_errors() or result.has_validation_errors():
+                        raise CommandError(f"import {number}/{round_} had errors")
+                    record('imports', started)
+            except Exception as e:
+                fail(e)
+            finally:
+                connections.close_all()
+
+        def reader():
+            factory = RequestFactory()
+            try:
+                for _ in range(options['rounds']):
+                    for model in (Work, Issue):
+                        request = factory.get(f'/admin/linear/{model._meta.model_name}/')
+                        request.user = user
+                        started = time.perf_counter()
+                        site._registry[model].changelist_view(request).render()
+                        record('reports', started)
+            except Exception as e:
+                fail(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=importer, args=(n,)) for n in range(options['importers'])]
+        threads += [threading.Thread(target=reader) for _ in range(options['readers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - started
+
+        report = {
+            'database': connections[DEFAULT_DB_ALIAS].vendor,
+            'read_database': 'read' in connections.settings,
+            'pragmas': sqlite.pragmas(connections[DEFAULT_DB_ALIAS]) if connections[DEFAULT_DB_ALIAS].vendor == 'sqlite' else {},
+            'wall_time': round(wall_time, 3),
+            'imports': latencies(results['imports']),
+            'reports': latencies(results['reports']),
+            'errors': results['errors'],
+        }
+
+        # One refresh of the touched days instead of one per imported row
+        signals.delete_issues(Issue.objects.filter(title__startswith=f"concurrency-{tag}-").values_list('pk', flat=True))
+        user.delete()
+
+        self.stdout.write(json.dumps(report, indent=2))
+        if results['errors']:
+            raise CommandError(f"{len(results['errors'])} threads failed.")
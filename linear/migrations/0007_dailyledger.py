@@ -0,0 +1,80 @@
+# Generated by Django 5.2 on 2026-10-18 14:51
+
+import datetime
+from itertools import groupby
+from django.db import migrations, models
+from django.utils import timezone
+
+# The overwork rules as they stood when the ledger was added, copied here
+# so the migration does not change with linear.overwork
+NINE_HOURS = datetime.timedelta(hours=9)
+
+
+def day_key(work):
+    return (timezone.localtime(work.start).date(), timezone.localtime(work.end).date())
+
+
+def nine_hour_mark(day_works):
+    running_total = datetime.timedelta()
+    for work in day_works:
+        if running_total + (work.end - work.start) > NINE_HOURS:
+            return work.start + (NINE_HOURS - running_total)
+        running_total += work.end - work.start
+    return None
+
+
+def row_overwork(work, mark):
+    if work.overwork_day:
+        return work.end - work.start
+    if mark is None or work.end <= mark:
+        return datetime.timedelta()
+    return work.end - max(work.start, mark)
+
+
+def summarize_days(works):
+    rows = sorted(((day_key(w), w.start, w.pk, w) for w in works), key=lambda r: r[:3])
+    for (day, end_day), group in groupby(rows, key=lambda r: r[0]):
+        day_works = [r[3] for r in group]
+        mark = nine_hour_mark(day_works)
+        yield {
+            'day': day,
+            'end_day': end_day,
+            'total_duration': sum((w.end - w.start for w in day_works), datetime.timedelta()),
+            'nine_hour_mark': mark,
+            'overwork': sum((row_overwork(w, mark) for w in day_works), datetime.timedelta()),
+            'work_count': len(day_works),
+        }
+
+
+def build_ledger(apps, schema_editor):
+    Work = apps.get_model('linear', 'Work')
+    DailyLedger = apps.get_model('linear', 'DailyLedger')
+    works = Work.objects.only('id', 'start', 'end', 'overwork_day').iterator(chunk_size=2000)
+    DailyLedger.objects.bulk_create((DailyLedger(**row) for row in summarize_days(works)), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linear', '0006_remove_issue_url_issue_title'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('end_day', models.DateField()),
+                ('total_duration', models.DurationField(default=datetime.timedelta)),
+                ('nine_hour_mark', models.DateTimeField(blank=True, null=True)),
+                ('overwork', models.DurationField(default=datetime.timedelta)),
+                ('work_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['day', 'end_day'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'end_day'), name='unique_ledger_day')],
+            },
+        ),
+        migrations.RunPython(build_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 14:59
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_work_date(apps, schema_editor):
+    Work = apps.get_model('linear', 'Work')
+    works = []
+    for work in Work.objects.only('id', 'start').iterator(chunk_size=2000):
+        work.work_date = timezone.localtime(work.start).date()
+        works.append(work)
+    Work.objects.bulk_update(works, ['work_date'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linear', '0007_dailyledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='work',
+            name='work_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_work_date, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='work',
+            name='work_date',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='work',
+            index=models.Index(fields=['work_date', 'start'], name='work_date_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='work',
+            index=models.Index(fields=['wage_month', 'start'], name='work_wage_month_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='work',
+            index=models.Index(fields=['issue', 'start'], name='work_issue_start_idx'),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2 on 2026-10-18 15:03
+
+import datetime
+import math
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+# The overwork and pay rules as they stood when the rollups were added,
+# copied here so the migration does not change with the app
+HOURLY_RATE = 250 * 10 ** 3
+OVERWORK_PREMIUM = 0.4
+
+
+def day_key(work):
+    return (timezone.localtime(work.start).date(), timezone.localtime(work.end).date())
+
+
+def row_overwork(work, mark):
+    if work.overwork_day:
+        return work.end - work.start
+    if mark is None or work.end <= mark:
+        return datetime.timedelta()
+    return work.end - max(work.start, mark)
+
+
+def hours(duration):
+    # Whole minutes, as hours
+    hours, remainder = divmod(int(duration.total_seconds()), 3600)
+    return hours + remainder // 60 / 60
+
+
+def payroll_value(total, overwork):
+    return math.floor(hours(total) * HOURLY_RATE + hours(overwork) * HOURLY_RATE * OVERWORK_PREMIUM)
+
+
+def build_rollups(apps, schema_editor):
+    Work = apps.get_model('linear', 'Work')
+    DailyLedger = apps.get_model('linear', 'DailyLedger')
+    PayrollRollup = apps.get_model('linear', 'PayrollRollup')
+    marks = {(row.day, row.end_day): row.nine_hour_mark for row in DailyLedger.objects.all()}
+    totals = {}
+    works = Work.objects.only('id', 'start', 'end', 'overwork_day', 'wage_month', 'issue_id').iterator(chunk_size=2000)
+    for work in works:
+        total, overwork = totals.get((work.wage_month, work.issue_id), (datetime.timedelta(), datetime.timedelta()))
+        totals[(work.wage_month, work.issue_id)] = (
+            total + (work.end - work.start),
+            overwork + row_overwork(work, marks.get(day_key(work))),
+        )
+    PayrollRollup.objects.bulk_create((
+        PayrollRollup(
+            wage_month=wage_month, issue_id=issue_id,
+            regular_duration=total - overwork, overwork_duration=overwork,
+            value=payroll_value(total, overwork),
+        )
+        for (wage_month, issue_id), (total, overwork) in totals.items()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linear', '0008_work_work_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('wage_month', models.CharField(blank=True, choices=[('فروردین', 'فروردین'), ('اردیبهشت', 'اردیبهشت'), ('خرداد', 'خرداد'), ('تیر', 'تیر'), ('مرداد', 'مرداد'), ('شهریور', 'شهریور'), ('مهر', 'مهر'), ('آبان', 'آبان'), ('آذر', 'آذر'), ('دی', 'دی'), ('بهمن', 'بهمن'), ('اسفند', 'اسفند')], max_length=2550, null=True, verbose_name='wage month')),
+                ('regular_duration', models.DurationField(default=datetime.timedelta)),
+                ('overwork_duration', models.DurationField(default=datetime.timedelta)),
+                ('value', models.BigIntegerField(default=0)),
+                ('issue', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll', to='linear.issue')),
+            ],
+            options={
+                'ordering': ['wage_month', 'issue'],
+                'constraints': [models.UniqueConstraint(fields=('wage_month', 'issue'), name='unique_payroll_month_issue')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
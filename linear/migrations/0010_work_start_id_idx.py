@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linear', '0009_payrollrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='work',
+            index=models.Index(fields=['start', 'id'], name='work_start_id_idx'),
+        ),
+    ]
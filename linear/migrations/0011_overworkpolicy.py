@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-18 15:11
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linear', '0010_work_start_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverworkPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valid_from', models.DateField(unique=True)),
+                ('threshold', models.DurationField(default=datetime.timedelta(seconds=32400))),
+                ('hourly_rate', models.PositiveBigIntegerField(default=250000)),
+                ('overwork_premium', models.FloatField(default=0.4)),
+            ],
+            options={
+                'verbose_name_plural': 'overwork policies',
+                'ordering': ['valid_from'],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='payrollrollup',
+            options={'ordering': ['wage_month', 'issue', 'policy_from']},
+        ),
+        migrations.RemoveConstraint(
+            model_name='payrollrollup',
+            name='unique_payroll_month_issue',
+        ),
+        migrations.AddField(
+            model_name='payrollrollup',
+            name='policy_from',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='payrollrollup',
+            constraint=models.UniqueConstraint(fields=('wage_month', 'issue', 'policy_from'), name='unique_payroll_month_issue_policy'),
+        ),
+    ]
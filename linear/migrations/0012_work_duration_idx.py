@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 15:15
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linear', '0011_overworkpolicy'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='work',
+            index=models.Index(models.ExpressionWrapper(django.db.models.expressions.CombinedExpression(models.F('end'), '-', models.F('start')), output_field=models.DurationField()), name='work_duration_idx'),
+        ),
+    ]
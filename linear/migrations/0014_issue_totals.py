@@ -0,0 +1,58 @@
+# Generated by Django 5.2 on 2026-10-18 15:24
+
+import datetime
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+
+
+def fill_totals(apps, schema_editor):
+    # Durations and counts from Work; overwork from the payroll rollups,
+    # which already hold it per issue
+    Issue = apps.get_model('linear', 'Issue')
+    Work = apps.get_model('linear', 'Work')
+    PayrollRollup = apps.get_model('linear', 'PayrollRollup')
+    works = Work.objects.values('issue').annotate(
+        total=Sum(ExpressionWrapper(F('end') - F('start'), output_field=DurationField())), count=Count('id'),
+    ).order_by()
+    overwork = dict(
+        PayrollRollup.objects.values('issue').annotate(overwork=Sum('overwork_duration')).values_list('issue', 'overwork').order_by()
+    )
+    Issue.objects.bulk_update(
+        (
+            Issue(
+                pk=row['issue'],
+                total_duration=row['total'] or datetime.timedelta(),
+                total_overwork=overwork.get(row['issue']) or datetime.timedelta(),
+                work_count=row['count'],
+            )
+            for row in works
+        ),
+        ['total_duration', 'total_overwork', 'work_count'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linear', '0013_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='total_duration',
+            field=models.DurationField(default=datetime.timedelta, editable=False),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='total_overwork',
+            field=models.DurationField(default=datetime.timedelta, editable=False),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='work_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
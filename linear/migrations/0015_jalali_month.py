@@ -0,0 +1,184 @@
+# Generated by Django 5.2 on 2026-10-18 15:31
+
+import datetime
+import math
+from bisect import bisect_right
+from django.db import migrations, models
+from django.utils import timezone
+
+# The calendar, overwork and pay rules as they stood when the Jalali month
+# key was added, copied here so the migration does not change with the app
+MONTH_NAMES = (
+    'فروردین', 'اردیبهشت', 'خرداد', 'تیر', 'مرداد', 'شهریور',
+    'مهر', 'آبان', 'آذر', 'دی', 'بهمن', 'اسفند',
+)
+BREAKS = (-61, 9, 38, 199, 426, 686, 756, 818, 1111, 1181, 1210, 1635, 2060, 2097, 2192, 2262, 2324, 2394, 2456, 3178)
+HOURLY_RATE = 250 * 10 ** 3
+OVERWORK_PREMIUM = 0.4
+
+
+def _div(a, b):
+    return int(a / b)
+
+
+def _mod(a, b):
+    return a - _div(a, b) * b
+
+
+def nowruz(year):
+    # Gregorian date of 1 Farvardin, from the 33-year cycle breaks
+    leap_j = -14
+    jp = BREAKS[0]
+    for jm in BREAKS[1:]:
+        jump = jm - jp
+        if year < jm:
+            break
+        leap_j += _div(jump, 33) * 8 + _div(_mod(jump, 33), 4)
+        jp = jm
+    n = year - jp
+    leap_j += _div(n, 33) * 8 + _div(_mod(n, 33) + 3, 4)
+    if _mod(jump, 33) == 4 and jump - n == 4:
+        leap_j += 1
+    gregorian_year = year + 621
+    leap_g = _div(gregorian_year, 4) - _div((_div(gregorian_year, 100) + 1) * 3, 4) - 150
+    return datetime.date(gregorian_year, 3, 20 + leap_j - leap_g)
+
+
+def jalali_month(day):
+    year = day.year - 621 if day >= nowruz(day.year - 621) else day.year - 622
+    day_of_year = (day - nowruz(year)).days
+    if day_of_year < 186:
+        return year, day_of_year // 31 + 1
+    return year, (day_of_year - 186) // 30 + 7
+
+
+def day_key(work):
+    return (timezone.localtime(work.start).date(), timezone.localtime(work.end).date())
+
+
+def row_overwork(work, mark):
+    if work.overwork_day:
+        return work.end - work.start
+    if mark is None or work.end <= mark:
+        return datetime.timedelta()
+    return work.end - max(work.start, mark)
+
+
+def hours(duration):
+    # Whole minutes, as hours
+    hours, remainder = divmod(int(duration.total_seconds()), 3600)
+    return hours + remainder // 60 / 60
+
+
+def payroll_value(total, overwork, hourly_rate, overwork_premium):
+    return math.floor(hours(total) * hourly_rate + hours(overwork) * hourly_rate * overwork_premium)
+
+
+def derive_months(apps, schema_editor):
+    # wage_month was editable until now and becomes derived from the work
+    # date, so hand-set values are replaced and cannot be restored
+    Work = apps.get_model('linear', 'Work')
+    works = []
+    for work in Work.objects.only('id', 'work_date').iterator(chunk_size=2000):
+        work.jalali_year, work.jalali_month = jalali_month(work.work_date)
+        work.wage_month = MONTH_NAMES[work.jalali_month - 1]
+        works.append(work)
+    Work.objects.bulk_update(works, ['jalali_year', 'jalali_month', 'wage_month'], batch_size=1000)
+
+
+def rebuild_rollups(apps, schema_editor):
+    # The rollups were keyed by month name across years; recompute them
+    # per Jalali month from the works and the ledger
+    Work = apps.get_model('linear', 'Work')
+    DailyLedger = apps.get_model('linear', 'DailyLedger')
+    OverworkPolicy = apps.get_model('linear', 'OverworkPolicy')
+    PayrollRollup = apps.get_model('linear', 'PayrollRollup')
+    # (valid_from, hourly_rate, overwork_premium) of each policy, with the
+    # defaults in force before the first one
+    policies = [(None, HOURLY_RATE, OVERWORK_PREMIUM), *OverworkPolicy.objects.order_by('valid_from').values_list(
+        'valid_from', 'hourly_rate', 'overwork_premium',
+    )]
+    dates = [policy[0] for policy in policies[1:]]
+    marks = {(row.day, row.end_day): row.nine_hour_mark for row in DailyLedger.objects.all()}
+    totals = {}
+    works = Work.objects.only(
+        'id', 'start', 'end', 'overwork_day', 'work_date', 'jalali_year', 'jalali_month', 'issue_id',
+    ).iterator(chunk_size=2000)
+    for work in works:
+        key = (work.jalali_year, work.jalali_month, work.issue_id, policies[bisect_right(dates, work.work_date)])
+        total, overwork = totals.get(key, (datetime.timedelta(), datetime.timedelta()))
+        totals[key] = (total + (work.end - work.start), overwork + row_overwork(work, marks.get(day_key(work))))
+    PayrollRollup.objects.all().delete()
+    PayrollRollup.objects.bulk_create((
+        PayrollRollup(
+            jalali_year=year, jalali_month=month, issue_id=issue_id, policy_from=valid_from,
+            regular_duration=total - overwork, overwork_duration=overwork,
+            value=payroll_value(total, overwork, hourly_rate, overwork_premium),
+        )
+        for (year, month, issue_id, (valid_from, hourly_rate, overwork_premium)), (total, overwork) in totals.items()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linear', '0014_issue_totals'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='payrollrollup',
+            options={'ordering': ['jalali_year', 'jalali_month', 'issue', 'policy_from']},
+        ),
+        migrations.RemoveConstraint(
+            model_name='payrollrollup',
+            name='unique_payroll_month_issue_policy',
+        ),
+        migrations.RemoveIndex(
+            model_name='work',
+            name='work_wage_month_start_idx',
+        ),
+        migrations.RemoveField(
+            model_name='payrollrollup',
+            name='wage_month',
+        ),
+        migrations.AddField(
+            model_name='payrollrollup',
+            name='jalali_month',
+            field=models.PositiveSmallIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='payrollrollup',
+            name='jalali_year',
+            field=models.PositiveSmallIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='work',
+            name='jalali_month',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='work',
+            name='jalali_year',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='work',
+            name='wage_month',
+            field=models.CharField(blank=True, choices=[('فروردین', 'فروردین'), ('اردیبهشت', 'اردیبهشت'), ('خرداد', 'خرداد'), ('تیر', 'تیر'), ('مرداد', 'مرداد'), ('شهریور', 'شهریور'), ('مهر', 'مهر'), ('آبان', 'آبان'), ('آذر', 'آذر'), ('دی', 'دی'), ('بهمن', 'بهمن'), ('اسفند', 'اسفند')], editable=False, max_length=2550, null=True, verbose_name='wage month'),
+        ),
+        migrations.RunPython(derive_months),
+        migrations.RunPython(rebuild_rollups, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='work',
+            index=models.Index(fields=['jalali_year', 'jalali_month', 'start'], name='work_jalali_month_start_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='payrollrollup',
+            constraint=models.UniqueConstraint(fields=('jalali_year', 'jalali_month', 'issue', 'policy_from'), name='unique_payroll_month_issue_policy'),
+        ),
+    ]
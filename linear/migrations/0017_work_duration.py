@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 19:40
+
+import datetime
+from django.db import migrations, models
+from django.db.models import DurationField, ExpressionWrapper, F
+
+
+def fill_duration(apps, schema_editor):
+    Work = apps.get_model('linear', 'Work')
+    Work.objects.update(duration=ExpressionWrapper(F('end') - F('start'), output_field=DurationField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linear', '0016_change_feed'),
+    ]
+
+    operations = [
+        # The expression index compiled to a function only Django's SQLite
+        # connections define, so plain sqlite3 writers could not insert
+        migrations.RemoveIndex(
+            model_name='work',
+            name='work_duration_idx',
+        ),
+        migrations.AddField(
+            model_name='work',
+            name='duration',
+            field=models.DurationField(db_index=True, default=datetime.timedelta(0), editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_duration, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-18 19:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linear', '0017_work_duration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='overworkpolicy',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 20:40
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fail_pickled_exports(apps, schema_editor):
+    # Their selection was only kept in the dropped pickled query
+    Job = apps.get_model('linear', 'Job')
+    Job.objects.filter(status__in=('queued', 'running'), query__isnull=False).update(
+        status='failed', message="Queued before an upgrade; queue the export again.", finished_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('linear', '0018_overworkpolicy_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_pickled_exports, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='job',
+            name='query',
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('version', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
@@ -1,27 +1,116 @@
-from django.db import models
-from django.db.models import F, ExpressionWrapper, DurationField
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import (
+    Case, DateTimeField, DurationField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When, Window,
+)
+from django.db.models.functions import Coalesce, TruncDate
 from datetime import timedelta
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 # Create your models here.
 class Issue(models.Model):
     title = models.CharField(max_length=255, null=True, blank=True)
+    # Totals of the Issue's works, kept up to date by linear.totals
+    total_duration = models.DurationField(default=timedelta, editable=False)
+    total_overwork = models.DurationField(default=timedelta, editable=False)
+    work_count = models.PositiveIntegerField(default=0, editable=False)
+    # Read by the change feed of linear.changes
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    TOTAL_FIELDS = ('total_duration', 'total_overwork', 'work_count')
 
     def duration(self):
         """
         Calculate the total duration of all related Work instances.
         """
-        # Query related Work objects and annotate their durations
-        total_duration = self.works.annotate(
-            duration=ExpressionWrapper(F('end') - F('start'), output_field=DurationField())
-        ).aggregate(total_duration=models.Sum('duration'))['total_duration']
+        total_duration = self.works.aggregate(total_duration=models.Sum('duration'))['total_duration']
 
         return total_duration or timedelta()
 
+    def save(self, *args, **kwargs):
+        # Saving an Issue loaded before its works changed must not write
+        # its stale totals back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name not in self.TOTAL_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.title
 
 
+class WorkQuerySet(models.QuerySet):
+    def _annotate_overwork(self, nine_hour_mark):
+        duration = ExpressionWrapper(F('end') - F('start'), output_field=DurationField())
+        return self.annotate(
+            start_day=F('work_date'),
+            end_day=TruncDate('end'),
+        ).annotate(
+            nine_hour_mark=nine_hour_mark,
+            overwork_duration=Case(
+                When(overwork_day=True, then=duration),
+                When(nine_hour_mark__isnull=True, then=Value(timedelta())),
+                When(start__gte=F('nine_hour_mark'), then=duration),
+                When(end__gt=F('nine_hour_mark'), then=ExpressionWrapper(
+                    F('end') - F('nine_hour_mark'), output_field=DurationField()
+                )),
+                default=Value(timedelta()),
+                output_field=DurationField(),
+            ),
+        )
+
+    def with_ledger_overwork(self):
+        """
+        Same annotations as `with_overwork`, but the nine-hour mark is read
+        from the precomputed DailyLedger row of each work's day.
+        """
+        mark = DailyLedger.objects.filter(
+            day=OuterRef('start_day'),
+            end_day=OuterRef('end_day'),
+        ).values('nine_hour_mark')[:1]
+        return self._annotate_overwork(Subquery(mark, output_field=DateTimeField()))
+
+    def with_overwork(self, threshold=None):
+        """
+        Annotate every Work with `nine_hour_mark` and `overwork_duration`
+        computed by the database, so totals, ordering and filtering by
+        overwork run as a single query.
+
+        The mark of a day is found with a running per-day
+        `Sum(end - start)` window ordered by start: it lies in the first
+        work whose running total passes the threshold. Without a
+        `threshold` each day uses the overwork policy in force on it.
+        """
+        from .policy import table
+
+        threshold = table().threshold_expression() if threshold is None else Value(threshold)
+        duration = ExpressionWrapper(F('end') - F('start'), output_field=DurationField())
+        # Same grouping as the Python engine: local start date and local end date
+        day = [F('work_date'), TruncDate('end')]
+        order = [F('start').asc(), F('id').asc()]
+        crossing = Work.objects.annotate(
+            end_day=TruncDate('end'),
+        ).filter(
+            work_date=OuterRef('start_day'),
+            end_day=OuterRef('end_day'),
+        ).annotate(
+            threshold=threshold,
+            running_total=Window(Sum(duration), partition_by=day, order_by=order),
+            mark=ExpressionWrapper(
+                F('start') + F('threshold') - Coalesce(
+                    Window(Sum(duration), partition_by=day, order_by=order, frame=models.RowRange(end=-1)),
+                    Value(timedelta()),
+                ),
+                output_field=DateTimeField(),
+            ),
+        ).filter(running_total__gt=F('threshold')).order_by('start', 'id').values('mark')[:1]
+
+        return self._annotate_overwork(Subquery(crossing, output_field=DateTimeField()))
+
+
 class Work(models.Model):
     PERSIAN_MONTHS = (
         ('فروردین', 'فروردین'),
@@ -43,53 +132,280 @@ class Work(models.Model):
     start = models.DateTimeField()
     end = models.DateTimeField()
     overwork_day = models.BooleanField(default=False)
-    wage_month = models.CharField(_("wage month"), max_length=2550, choices=PERSIAN_MONTHS, blank=True, null=True, default='فروردین')
+    # Name of jalali_month, kept for display and exports
+    wage_month = models.CharField(_("wage month"), max_length=2550, choices=PERSIAN_MONTHS, blank=True, null=True, editable=False)
+    # Local date of start, stored so day lookups need no per-row date cast
+    work_date = models.DateField(editable=False)
+    # Jalali year and month of work_date: the wage month key
+    jalali_year = models.PositiveSmallIntegerField(editable=False)
+    jalali_month = models.PositiveSmallIntegerField(editable=False)
+    # end - start, stored so the longest work (the bound of the overlap
+    # lookups of linear.overlaps) is read from a plain index
+    duration = models.DurationField(editable=False, db_index=True)
+    # Read by the change feed of linear.changes
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = WorkQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['work_date', 'start'], name='work_date_start_idx'),
+            models.Index(fields=['jalali_year', 'jalali_month', 'start'], name='work_jalali_month_start_idx'),
+            models.Index(fields=['issue', 'start'], name='work_issue_start_idx'),
+            models.Index(fields=['start', 'id'], name='work_start_id_idx'),
+            models.Index(fields=['updated_at', 'id'], name='work_updated_at_idx'),
+        ]
+
+    DERIVED_FIELDS = ('work_date', 'jalali_year', 'jalali_month', 'wage_month', 'duration')
+
+    def set_work_date(self):
+        """
+        Derive `work_date` and the Jalali wage month from `start`, and
+        `duration` from start and end. Called by save(); bulk_create
+        callers must call it themselves.
+        """
+        from .jalali import from_gregorian, month_name
+
+        self.work_date = timezone.localtime(self.start).date()
+        self.jalali_year, self.jalali_month, _ = from_gregorian(self.work_date)
+        self.wage_month = month_name(self.jalali_month)
+        self.duration = self.end - self.start
 
     @property
-    def duration(self):
-        return self.end - self.start
+    def month_label(self):
+        from .jalali import month_label
+
+        return month_label(self.jalali_year, self.jalali_month)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_span = instance._span()
+        return instance
+
+    def _span(self):
+        # Deferred fields read as None, so the overlap check still runs
+        return tuple(self.__dict__.get(name) for name in ('start', 'end', 'issue_id'))
+
+    def clean(self):
+        super().clean()
+        if self.start is None or self.end is None:
+            return
+        # An unchanged work is not checked again, so an Issue whose stored
+        # works already overlap (imports, bulk edits) can still be saved
+        if self.pk and getattr(self, '_stored_span', None) == self._span():
+            return
+        from .overlaps import conflicts, describe
+        others = conflicts(self)
+        if others:
+            raise ValidationError(
+                _("This work overlaps %(works)s."),
+                params={'works': ', '.join(describe(w) for w in others)},
+                code='overlap',
+            )
+
+    def save(self, *args, **kwargs):
+        self.set_work_date()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'start', 'end'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, *self.DERIVED_FIELDS}
+        # post_save refreshes the ledger, rollups and totals; they commit or
+        # roll back with the row. Deletes already send post_delete in the
+        # deleting transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._stored_span = self._span()
 
     @property
     def overwork_duration(self):
-        if self.overwork_day:
-            return self.end - self.start
-        else:
-            # Get all works from same day
-            same_day_works = Work.objects.filter(
-                start__date=self.start.date(),
-                end__date=self.end.date()
-            ).order_by('start')
-            
-            # Calculate total duration for the day
-            total_duration = timedelta()
-            for work in same_day_works:
-                total_duration += work.end - work.start
-            
-            # If total duration is less than 9 hours, no overwork
-            if total_duration <= timedelta(hours=9):
-                return timedelta()
-            
-            # Calculate when the 9-hour mark is passed
-            nine_hour_mark = None
-            running_total = timedelta()
-            for work in same_day_works:
-                work_duration = work.end - work.start
-                if running_total + work_duration > timedelta(hours=9):
-                    # This is the work where 9-hour mark is passed
-                    nine_hour_mark = work.start + (timedelta(hours=9) - running_total)
-                    break
-                running_total += work_duration
-            
-            # If this work starts after the 9-hour mark, it's all overwork
-            if self.start >= nine_hour_mark:
-                return self.end - self.start
-            
-            # If this work spans the 9-hour mark
-            if self.start < nine_hour_mark and self.end > nine_hour_mark:
-                return self.end - nine_hour_mark
-            
-            # If this work is entirely before the 9-hour mark
-            return timedelta()
+        # Use the value cached by a batch computation when there is one
+        if hasattr(self, '_overwork_duration'):
+            return self._overwork_duration
+        from .overwork import compute_overwork, day_key, row_overwork
+        # Read the day's precomputed nine-hour mark instead of rescanning the day
+        day, end_day = day_key(self)
+        ledger = DailyLedger.objects.filter(day=day, end_day=end_day).only('nine_hour_mark').first()
+        if ledger is not None:
+            return row_overwork(self, ledger.nine_hour_mark)
+        return compute_overwork([self])[self.pk]
+
+    @overwork_duration.setter
+    def overwork_duration(self, value):
+        # Filled in by WorkQuerySet.with_overwork()
+        self._overwork_duration = value
+
+    def __str__(self):
+        return self.issue.title
+
+
+class DailyLedger(models.Model):
+    """
+    Per-day totals of Work, kept up to date by linear.ledger.
+    A day is keyed by the local start and end dates of its works, so a
+    session running past midnight has its own row.
+    """
+    day = models.DateField()
+    end_day = models.DateField()
+    total_duration = models.DurationField(default=timedelta)
+    nine_hour_mark = models.DateTimeField(blank=True, null=True)
+    overwork = models.DurationField(default=timedelta)
+    work_count = models.PositiveIntegerField(default=0)
+    # Set whenever the day is recomputed, so the change feed can find the
+    # works whose overwork may have moved
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'end_day'], name='unique_ledger_day'),
+        ]
+        ordering = ['day', 'end_day']
+
+    def __str__(self):
+        return str(self.day)
+
+
+class PayrollRollup(models.Model):
+    """
+    Hours and pay of one Issue in one wage month, kept up to date by
+    linear.payroll so month-end reports are a lookup. Works under
+    different overwork policies are rolled up separately.
+    """
+    jalali_year = models.PositiveSmallIntegerField()
+    jalali_month = models.PositiveSmallIntegerField()
+    issue = models.ForeignKey(Issue, on_delete=models.CASCADE, related_name='payroll')
+    # valid_from of the OverworkPolicy in force, null for the defaults
+    policy_from = models.DateField(null=True, blank=True, editable=False)
+    regular_duration = models.DurationField(default=timedelta)
+    overwork_duration = models.DurationField(default=timedelta)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['jalali_year', 'jalali_month', 'issue', 'policy_from'], name='unique_payroll_month_issue_policy',
+            ),
+        ]
+        ordering = ['jalali_year', 'jalali_month', 'issue', 'policy_from']
+
+    @property
+    def total_duration(self):
+        return self.regular_duration + self.overwork_duration
+
+    @property
+    def month_label(self):
+        from .jalali import month_label
+
+        return month_label(self.jalali_year, self.jalali_month)
+
+    def __str__(self):
+        return f"{self.month_label} {self.issue}"
+
+
+class OverworkPolicy(models.Model):
+    """
+    Overwork threshold and pay rates in force from `valid_from` until the
+    next policy starts. Days before the first policy use the defaults of
+    linear.policy.
+    """
+    valid_from = models.DateField(unique=True)
+    threshold = models.DurationField(default=timedelta(hours=9))
+    hourly_rate = models.PositiveBigIntegerField(default=250 * 10 ** 3)
+    overwork_premium = models.FloatField(default=0.4)
+    # Part of the version every process compares its compiled table with
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['valid_from']
+        verbose_name_plural = "overwork policies"
+
+    def __str__(self):
+        return f"from {self.valid_from}"
+
+
+class Tombstone(models.Model):
+    """
+    A deleted Work or Issue, kept so the change feed can report the
+    deletion.
+    """
+    model = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'deleted_at'], name='tombstone_model_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id}"
+
+
+class CacheVersion(models.Model):
+    """
+    Version of a set of cached values, such as the changelist summaries or
+    one time series bucket. Every process reads it from the database, so a
+    change made in any process invalidates the caches of all of them.
+    """
+    name = models.CharField(max_length=64, primary_key=True)
+    version = models.CharField(max_length=32)
+
+    def __str__(self):
+        return self.name
+
+
+class Job(models.Model):
+    """
+    An export or full recompute queued for `manage.py run_linear_worker`
+    instead of running inside an admin request. Exports leave their file
+    in `result`.
+    """
+    EXPORT_WORKS = 'export_works'
+    EXPORT_ISSUES = 'export_issues'
+    REBUILD_LEDGER = 'rebuild_ledger'
+    REBUILD_PAYROLL = 'rebuild_payroll'
+    KINDS = (
+        (EXPORT_WORKS, "Export works"),
+        (EXPORT_ISSUES, "Export issues"),
+        (REBUILD_LEDGER, "Rebuild the daily ledger"),
+        (REBUILD_PAYROLL, "Rebuild the payroll rollups"),
+    )
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    kind = models.CharField(max_length=32, choices=KINDS)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED, editable=False)
+    message = models.TextField(blank=True, default="", editable=False)
+    result = models.FileField(upload_to='linear/jobs/', blank=True, editable=False)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='+', editable=False,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Renewed by the worker while the job runs; a running job whose
+    # heartbeat is older than the lease lost its worker and is requeued
+    heartbeat_at = models.DateTimeField(null=True, blank=True, editable=False)
+    attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+    finished_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='job_status_idx'),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
 
     def __str__(self):
-        return self.issue.title
\ No newline at end of file
+        return f"{self.get_kind_display()} #{self.pk}"
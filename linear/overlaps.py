@@ -0,0 +1,82 @@
+from django.db.models import DateTimeField, Exists, ExpressionWrapper, F, Max, OuterRef, Value
+from django.utils import timezone
+
+# Conflicts listed in a validation error
+MAX_REPORTED = 5
+
+
+def sweep(rows):
+    """
+    Yield (id, other id, overlap) for every work that starts before an
+    earlier work ends. `rows` are (id, start, end) sorted by (start, id);
+    `other` is the earlier work reaching furthest, so nested and chained
+    overlaps are found in one pass.
+    """
+    reach = None
+    for pk, start, end in rows:
+        if reach is not None and start < reach[0]:
+            yield pk, reach[1], min(end, reach[0]) - start
+        if reach is None or end > reach[0]:
+            reach = (end, pk)
+
+
+def scan(works=None):
+    """
+    Every overlap of `works` (all Works by default), read in start order
+    through the (start, id) index.
+    """
+    from .models import Work
+
+    works = Work.objects.all() if works is None else works
+    return list(sweep(works.order_by('start', 'id').values_list('id', 'start', 'end').iterator(chunk_size=5000)))
+
+
+def longest():
+    """
+    Duration of the longest Work, read from the end of the duration
+    index; None when there are no works. A work overlapping another must start at
+    most this long before it, which bounds every overlap lookup.
+    """
+    from .models import Work
+
+    return Work.objects.aggregate(longest=Max('duration'))['longest']
+
+
+def conflicts(work):
+    """
+    Stored Works overlapping `work`: one range lookup on the start index,
+    bounded by the longest work, instead of a scan of the day.
+    """
+    from .models import Work
+
+    bound = longest()
+    if bound is None:
+        return []
+    others = Work.objects.exclude(pk=work.pk) if work.pk else Work.objects.all()
+    return list(others.filter(
+        start__gte=work.start - bound, start__lt=work.end, end__gt=work.start,
+    ).order_by('start', 'id')[:MAX_REPORTED])
+
+
+def describe(work):
+    start, end = timezone.localtime(work.start), timezone.localtime(work.end)
+    return f"#{work.pk} {start:%Y-%m-%d %H:%M} - {end:%Y-%m-%d %H:%M}"
+
+
+def with_overlap(works):
+    """
+    Alias `has_overlap` on `works` with the same bounded lookup as
+    `conflicts`, run as one EXISTS per row.
+    """
+    from .models import Work
+
+    bound = longest()
+    if bound is None:
+        return works.alias(has_overlap=Value(False))
+    works = works.alias(
+        overlap_from=ExpressionWrapper(F('start') - Value(bound), output_field=DateTimeField()),
+    )
+    others = Work.objects.filter(
+        start__gte=OuterRef('overlap_from'), start__lt=OuterRef('end'), end__gt=OuterRef('start'),
+    ).exclude(pk=OuterRef('pk'))
+    return works.alias(has_overlap=Exists(others))
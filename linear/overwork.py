@@ -0,0 +1,164 @@
+from collections import defaultdict
+from datetime import timedelta
+from itertools import groupby
+from django.utils import timezone
+from .sqlite import chunked
+
+NINE_HOURS = timedelta(hours=9)
+
+
+def day_key(work, tz=None):
+    """
+    The (local start date, local end date) pair a Work is grouped by.
+    Works that span midnight share a day only with other works spanning
+    the same midnight, exactly like the `start__date`/`end__date` lookup.
+    The start date is the stored `work_date` when it is loaded; callers
+    keying many works pass the time zone they resolved once.
+    """
+    tz = tz or timezone.get_current_timezone()
+    day = work.__dict__.get('work_date') or work.start.astimezone(tz).date()
+    return (day, work.end.astimezone(tz).date())
+
+
+def _keyed(works):
+    """
+    Sort `works` by (day_key, start, pk), keying each row once.
+    """
+    tz = timezone.get_current_timezone()
+    return sorted(((day_key(w, tz), w.start, w.pk or 0, w) for w in works), key=lambda r: r[:3])
+
+
+def nine_hour_mark(day_works, threshold=NINE_HOURS):
+    """
+    Return the moment the day's running total passes `threshold`, or None
+    when the day never goes over it. `day_works` must be sorted by start.
+    """
+    running_total = timedelta()
+    for work in day_works:
+        work_duration = work.end - work.start
+        if running_total + work_duration > threshold:
+            return work.start + (threshold - running_total)
+        running_total += work_duration
+    return None
+
+
+def row_overwork(work, mark):
+    """
+    Overwork of a single row given its day's nine-hour mark.
+    """
+    if work.overwork_day:
+        return work.end - work.start
+    if mark is None:
+        return timedelta()
+    # If this work starts after the 9-hour mark, it's all overwork
+    if work.start >= mark:
+        return work.end - work.start
+    # If this work spans the 9-hour mark
+    if work.end > mark:
+        return work.end - mark
+    # If this work is entirely before the 9-hour mark
+    return timedelta()
+
+
+def day_thresholds(threshold=None):
+    """
+    Function from a local date to its overwork threshold: `threshold` for
+    every day, or the threshold of the policy in force on the day when
+    `threshold` is None.
+    """
+    if threshold is not None:
+        return lambda day: threshold
+    from .policy import table
+
+    policies = table()
+    return lambda day: policies.for_day(day).threshold
+
+
+def day_marks(day_works, threshold=None):
+    """
+    Group `day_works` by local day, sort them once and return
+    {day_key: nine_hour_mark} computed in a single sweep.
+    """
+    thresholds = day_thresholds(threshold)
+    marks = {}
+    for key, group in groupby(_keyed(day_works), key=lambda r: r[0]):
+        marks[key] = nine_hour_mark((r[3] for r in group), thresholds(key[0]))
+    return marks
+
+
+def _day_candidates(keys):
+    """
+    Fetch every Work that can share a day with `keys`: those on exactly
+    the touched days of the indexed `work_date`, in one query per chunk
+    of days, so far apart days do not pull in everything between them.
+    """
+    from .models import Work
+
+    for days in chunked(sorted({k[0] for k in keys})):
+        yield from Work.objects.filter(work_date__in=days).only('id', 'start', 'end', 'work_date', 'overwork_day')
+
+
+def compute_overwork(works, threshold=None):
+    """
+    Return {work.pk: overwork duration} for every Work in `works`
+    (a queryset or any iterable of Works) using a single query for
+    all the days involved. Without a `threshold` each day uses the
+    overwork policy in force on it.
+    """
+    works = list(works)
+    if not works:
+        return {}
+    tz = timezone.get_current_timezone()
+    keyed = [(w, day_key(w, tz)) for w in works]
+    keys = {key for _, key in keyed}
+    thresholds = day_thresholds(threshold)
+    candidates = defaultdict(list)
+    for candidate in _day_candidates(keys):
+        key = day_key(candidate, tz)
+        if key in keys:
+            candidates[key].append(candidate)
+    marks = {}
+    for key, rows in candidates.items():
+        rows.sort(key=lambda w: (w.start, w.pk or 0))
+        marks[key] = nine_hour_mark(rows, thresholds(key[0]))
+    return {w.pk: row_overwork(w, marks.get(key)) for w, key in keyed}
+
+
+def prefetch_overwork(works, threshold=None):
+    """
+    Compute overwork for `works` in one pass and cache it on each
+    instance so `Work.overwork_duration` does not query again.
+    Returns the list of works.
+    """
+    works = list(works)
+    overwork = compute_overwork(works, threshold)
+    for work in works:
+        work._overwork_duration = overwork[work.pk]
+    return works
+
+
+def total_overwork(works, threshold=None):
+    """
+    Sum of the overwork of every Work in `works`.
+    """
+    return sum(compute_overwork(works, threshold).values(), timedelta())
+
+
+def summarize_days(works, threshold=None):
+    """
+    Yield one dict per local day of `works` with the day's total
+    duration, nine-hour mark, overwork total and number of works.
+    `works` must hold every Work of the days involved.
+    """
+    thresholds = day_thresholds(threshold)
+    for (day, end_day), group in groupby(_keyed(works), key=lambda r: r[0]):
+        day_works = [r[3] for r in group]
+        mark = nine_hour_mark(day_works, thresholds(day))
+        yield {
+            'day': day,
+            'end_day': end_day,
+            'total_duration': sum((w.end - w.start for w in day_works), timedelta()),
+            'nine_hour_mark': mark,
+            'overwork': sum((row_overwork(w, mark) for w in day_works), timedelta()),
+            'work_count': len(day_works),
+        }
@@ -0,0 +1,146 @@
+from datetime import date, timedelta
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import DurationField, ExpressionWrapper, F, Q, Sum
+from .models import Issue, PayrollRollup, Work
+from .jalali import month_name
+from .sqlite import CHUNK_SIZE, chunked
+from . import policy, totals
+
+
+def _key_filter(keys):
+    return reduce(or_, (Q(jalali_year=year, jalali_month=month, issue_id=issue) for year, month, issue in keys))
+
+
+def _rollups(works):
+    """
+    One unsaved PayrollRollup per (Jalali month, issue, policy period) of
+    `works`, with overwork read from the daily ledger in the same grouped
+    query.
+    """
+    policies = policy.table()
+    rows = works.with_ledger_overwork().values(
+        'jalali_year', 'jalali_month', 'issue', policy_from=policies.period_expression(),
+    ).annotate(
+        total=Sum(ExpressionWrapper(F('end') - F('start'), output_field=DurationField())),
+        overwork=Sum('overwork_duration'),
+    ).order_by()
+    for row in rows:
+        total, overwork = row['total'] or timedelta(), row['overwork'] or timedelta()
+        yield PayrollRollup(
+            jalali_year=row['jalali_year'],
+            jalali_month=row['jalali_month'],
+            issue_id=row['issue'],
+            policy_from=row['policy_from'],
+            regular_duration=total - overwork,
+            overwork_duration=overwork,
+            value=policies.period(row['policy_from']).value(total, overwork),
+        )
+
+
+def refresh(days=(), keys=()):
+    """
+    Recompute the rollups of the given (jalali_year, jalali_month, issue
+    id) keys and of every key with a work on `days`, and the stored totals of their
+    Issues. A change to one work can move the overwork of every work on
+    its day, so whole days are refreshed. Must run after the ledger rows
+    of `days` are up to date.
+    """
+    keys = set(keys)
+    for chunk in chunked(sorted(set(days))):
+        keys.update(
+            Work.objects.filter(work_date__in=chunk)
+            .values_list('jalali_year', 'jalali_month', 'issue_id').distinct()
+        )
+    keys = sorted(keys)
+    with transaction.atomic():
+        _lock_issues({issue for _, _, issue in keys})
+        # Each key binds three parameters
+        for chunk in chunked(keys, CHUNK_SIZE // 3):
+            condition = _key_filter(chunk)
+            PayrollRollup.objects.filter(condition).delete()
+            PayrollRollup.objects.bulk_create(_rollups(Work.objects.filter(condition)))
+        totals.refresh(issue for _, _, issue in keys)
+
+
+def _lock_issues(issue_ids):
+    # Rollups are replaced by a delete and insert rather than an upsert, as
+    # their unique key holds the nullable policy_from, which ON CONFLICT
+    # never matches. Locking their Issues first, in a fixed order, makes
+    # concurrent refreshes of the same rollups wait for each other instead
+    # of both inserting them. SQLite already serializes writers.
+    for chunk in chunked(sorted(issue_ids)):
+        list(Issue.objects.select_for_update().filter(pk__in=chunk).order_by('pk').values_list('pk'))
+
+
+def rebuild():
+    """
+    Drop and recompute every rollup. Returns the number of rows written.
+    """
+    with transaction.atomic():
+        list(Issue.objects.select_for_update().order_by('pk').values_list('pk'))
+        PayrollRollup.objects.all().delete()
+        return len(PayrollRollup.objects.bulk_create(_rollups(Work.objects.all()), batch_size=1000))
+
+
+def check():
+    """
+    Compare the stored rollups with a live computation. Returns a list of
+    (jalali_year, jalali_month, issue id, policy_from, field, stored,
+    live) differences.
+    """
+    fields = ('regular_duration', 'overwork_duration', 'value')
+    live = {(r.jalali_year, r.jalali_month, r.issue_id, r.policy_from): r for r in _rollups(Work.objects.all())}
+    stored = {(r.jalali_year, r.jalali_month, r.issue_id, r.policy_from): r for r in PayrollRollup.objects.all()}
+    differences = []
+    for key in sorted(live.keys() | stored.keys(), key=lambda k: (*k[:3], k[3] or date.min)):
+        for field in fields:
+            stored_value = getattr(stored[key], field) if key in stored else None
+            live_value = getattr(live[key], field) if key in live else None
+            if stored_value != live_value:
+                differences.append((*key, field, stored_value, live_value))
+    return differences
+
+
+def pay(rollups):
+    """
+    Pay of `rollups` in one grouped query: each policy period is paid at
+    its own rates on its summed durations, like `policy.pay`.
+    """
+    policies = policy.table()
+    rows = rollups.values('policy_from').annotate(
+        regular=Sum('regular_duration'), overwork=Sum('overwork_duration'),
+    ).order_by()
+    return sum(policies.period(row['policy_from']).value(row['regular'] + row['overwork'], row['overwork']) for row in rows)
+
+
+def month_totals(rollups=None):
+    """
+    Regular, overwork and total duration and pay of each Jalali month of
+    `rollups` (all of them by default), in one grouped query. Pay is
+    computed from a month's summed durations under each policy, like the
+    Work changelist filtered by that month.
+    """
+    rollups = PayrollRollup.objects.all() if rollups is None else rollups
+    policies = policy.table()
+    rows = rollups.values('jalali_year', 'jalali_month', 'policy_from').annotate(
+        regular=Sum('regular_duration'), overwork=Sum('overwork_duration'),
+    ).order_by('jalali_year', 'jalali_month', 'policy_from')
+    months = {}
+    for row in rows:
+        total = row['regular'] + row['overwork']
+        month = months.setdefault((row['jalali_year'], row['jalali_month']), {
+            'jalali_year': row['jalali_year'],
+            'jalali_month': row['jalali_month'],
+            'wage_month': month_name(row['jalali_month']),
+            'regular_duration': timedelta(),
+            'overwork_duration': timedelta(),
+            'total_duration': timedelta(),
+            'value': 0,
+        })
+        month['regular_duration'] += row['regular']
+        month['overwork_duration'] += row['overwork']
+        month['total_duration'] += total
+        month['value'] += policies.period(row['policy_from']).value(total, row['overwork'])
+    return list(months.values())
@@ -0,0 +1,125 @@
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from django.conf import settings
+from django.db.models import Case, Count, DateField, DurationField, ExpressionWrapper, F, Max, Sum, Value, When
+from .overwork import NINE_HOURS
+from .summary import HOURLY_RATE, OVERWORK_PREMIUM, payroll_value
+
+class Policy(namedtuple('Policy', 'valid_from threshold hourly_rate overwork_premium')):
+    """
+    Compiled OverworkPolicy. `valid_from` is None for the defaults used
+    before the first policy.
+    """
+    def value(self, total_duration, total_overwork):
+        return payroll_value(total_duration, total_overwork, self.hourly_rate, self.overwork_premium)
+
+
+DEFAULT = Policy(None, NINE_HOURS, HOURLY_RATE, OVERWORK_PREMIUM)
+
+
+class PolicyTable:
+    """
+    Policies sorted by `valid_from`. Each is in force from its date until
+    the next one starts; `for_day` finds it with a binary search.
+    """
+    def __init__(self, policies=()):
+        policies = sorted(policies)
+        self.dates = [p.valid_from for p in policies]
+        self.policies = [DEFAULT, *policies]
+        self.by_date = {p.valid_from: p for p in self.policies}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def for_day(self, day):
+        return self.policies[bisect_right(self.dates, day)]
+
+    def period(self, valid_from):
+        """
+        Policy of a period key as returned by `period_expression`.
+        """
+        return self.by_date.get(valid_from) or self.for_day(valid_from)
+
+    def _case(self, field, attribute, output_field):
+        if not self.dates:
+            return Value(getattr(DEFAULT, attribute), output_field=output_field)
+        return Case(
+            *(When(**{f'{field}__gte': p.valid_from}, then=Value(getattr(p, attribute))) for p in reversed(self.policies[1:])),
+            default=Value(getattr(DEFAULT, attribute)),
+            output_field=output_field,
+        )
+
+    def period_expression(self, field='work_date'):
+        """
+        SQL for the `valid_from` of the policy in force on the date
+        `field`, NULL before the first policy.
+        """
+        return self._case(field, 'valid_from', DateField())
+
+    def threshold_expression(self, field='work_date'):
+        """
+        SQL for the overwork threshold in force on the date `field`.
+        """
+        return self._case(field, 'threshold', DurationField())
+
+
+_compiled = {'version': None, 'table': None, 'checked': None}
+
+
+def version():
+    """
+    (latest change, count) of the OverworkPolicy rows. Every process
+    reads the same value, and a save or delete anywhere changes it.
+    """
+    from .models import OverworkPolicy
+
+    row = OverworkPolicy.objects.aggregate(changed=Max('updated_at'), count=Count('id'))
+    return row['changed'], row['count']
+
+
+def table():
+    """
+    The compiled PolicyTable. Its version is read again from the database
+    at most every LINEAR_POLICY_CHECK_SECONDS, so a change made by
+    another process is picked up within that time; `invalidate()` makes
+    this process read it at once.
+    """
+    from .models import OverworkPolicy
+
+    now = time.monotonic()
+    checked = _compiled['checked']
+    if _compiled['table'] is not None and checked is not None and now - checked < settings.LINEAR_POLICY_CHECK_SECONDS:
+        return _compiled['table']
+    current = version()
+    if _compiled['table'] is None or _compiled['version'] != current:
+        policies = OverworkPolicy.objects.values_list('valid_from', 'threshold', 'hourly_rate', 'overwork_premium')
+        _compiled['table'] = PolicyTable(Policy(*row) for row in policies)
+        _compiled['version'] = current
+    _compiled['checked'] = now
+    return _compiled['table']
+
+
+def invalidate():
+    _compiled['table'] = None
+
+
+def period_totals(works, policies=None):
+    """
+    [(policy, total duration, total overwork)] of `works`, which must be
+    annotated with `overwork_duration`, in one query grouped by policy
+    period.
+    """
+    policies = table() if policies is None else policies
+    rows = works.values(policy_from=policies.period_expression()).annotate(
+        total=Sum(ExpressionWrapper(F('end') - F('start'), output_field=DurationField())),
+        overwork=Sum('overwork_duration'),
+    ).order_by()
+    return [(policies.period(row['policy_from']), row['total'], row['overwork']) for row in rows if row['total'] is not None]
+
+
+def pay(totals):
+    """
+    Pay of `period_totals`: each period at its own rates.
+    """
+    return sum(policy.value(total, overwork) for policy, total, overwork in totals)
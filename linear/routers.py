@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_reading = ContextVar('linear_reads', default=False)
+
+
+@contextmanager
+def reads():
+    """
+    Send the reads made inside the block to LINEAR_READ_DATABASE, when
+    that database is configured. Use it around read-only reports.
+    """
+    token = _reading.set(True)
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+class ReportReadRouter:
+    """
+    Route reads made inside `reads()` to the read connection. Reads made
+    inside a transaction on the default database stay there, so they see
+    its uncommitted writes.
+    """
+    def db_for_read(self, model, **hints):
+        alias = settings.LINEAR_READ_DATABASE
+        if not _reading.get() or alias not in connections.settings:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == settings.LINEAR_READ_DATABASE:
+            return False
+        return None
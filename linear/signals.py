@@ -0,0 +1,125 @@
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import Issue, OverworkPolicy, Tombstone, Work
+from .sqlite import chunked
+from . import ledger, payroll, policy, summary
+
+_state = threading.local()
+
+
+@contextmanager
+def muted():
+    """
+    Skip the Work and Issue receivers below inside the block. The caller
+    refreshes what they would have refreshed itself.
+    """
+    previous = getattr(_state, 'muted', False)
+    _state.muted = True
+    try:
+        yield
+    finally:
+        _state.muted = previous
+
+
+def _unless_muted(function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if not getattr(_state, 'muted', False):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def delete_issues(issue_ids):
+    """
+    Delete the given Issues and their works without the per-row receivers,
+    for throwaway rows such as load test data: no Tombstones reach the
+    change feed, and the ledger days the works were on are refreshed once
+    at the end, along with the payroll rollups and totals of the works
+    left on them.
+    """
+    days = set()
+    with transaction.atomic():
+        with muted():
+            for chunk in chunked(sorted(set(issue_ids))):
+                works = Work.objects.filter(issue__in=chunk)
+                days.update(works.values_list('work_date', flat=True).distinct())
+                works.delete()
+                Issue.objects.filter(pk__in=chunk).delete()
+        ledger.refresh_days(days)
+    summary.invalidate()
+
+
+@receiver(pre_save, sender=Work)
+@_unless_muted
+def remember_previous_day(sender, instance, raw=False, **kwargs):
+    # A changed start or issue moves the work away from a ledger day or
+    # payroll rollup, which needs a refresh too
+    instance._ledger_previous_day = None
+    instance._payroll_previous_key = None
+    if instance.pk and not raw:
+        previous = Work.objects.filter(pk=instance.pk).values_list('start', 'jalali_year', 'jalali_month', 'issue_id').first()
+        if previous is not None:
+            instance._ledger_previous_day = timezone.localtime(previous[0]).date()
+            instance._payroll_previous_key = previous[1:]
+
+
+@receiver(post_save, sender=Work)
+@_unless_muted
+def refresh_ledger_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    days = {ledger.work_day(instance)}
+    if getattr(instance, '_ledger_previous_day', None):
+        days.add(instance._ledger_previous_day)
+    ledger.refresh_days(days)
+    previous_key = getattr(instance, '_payroll_previous_key', None)
+    if previous_key and previous_key != (instance.jalali_year, instance.jalali_month, instance.issue_id):
+        payroll.refresh(keys={previous_key})
+
+
+@receiver(post_delete, sender=Work)
+@_unless_muted
+def refresh_ledger_on_delete(sender, instance, **kwargs):
+    ledger.refresh_days({ledger.work_day(instance)})
+    payroll.refresh(keys={(instance.jalali_year, instance.jalali_month, instance.issue_id)})
+
+
+@receiver(post_save, sender=Work)
+@receiver(post_delete, sender=Work)
+@receiver(post_save, sender=Issue)
+@receiver(post_delete, sender=Issue)
+@_unless_muted
+def invalidate_summaries(sender, **kwargs):
+    summary.invalidate()
+
+
+@receiver(post_delete, sender=Work)
+@receiver(post_delete, sender=Issue)
+@_unless_muted
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(model=sender._meta.model_name, object_id=instance.pk)
+
+
+@receiver(pre_save, sender=OverworkPolicy)
+def remember_previous_policy_date(sender, instance, raw=False, **kwargs):
+    instance._previous_valid_from = None
+    if instance.pk and not raw:
+        instance._previous_valid_from = OverworkPolicy.objects.filter(pk=instance.pk).values_list('valid_from', flat=True).first()
+
+
+@receiver(post_save, sender=OverworkPolicy)
+@receiver(post_delete, sender=OverworkPolicy)
+def refresh_after_policy_change(sender, instance, raw=False, **kwargs):
+    # Recompile the policy table, then redo every day the change can reach:
+    # everything from the earliest of the old and new start dates
+    policy.invalidate()
+    if raw:
+        return
+    since = min(filter(None, (instance.valid_from, getattr(instance, '_previous_valid_from', None))))
+    ledger.refresh_days(Work.objects.filter(work_date__gte=since).values_list('work_date', flat=True).distinct())
+    summary.invalidate()
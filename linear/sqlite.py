@@ -0,0 +1,40 @@
+from itertools import islice
+from django.conf import settings
+
+# Values bound per `__in` list, below SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+
+def chunked(iterable, size=CHUNK_SIZE):
+    """
+    Yield the items of `iterable` as lists of at most `size`, so `__in`
+    lookups over them stay below SQLite's bound parameter limit.
+    """
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """
+    connection_created receiver: run LINEAR_SQLITE_PRAGMAS on every new
+    SQLite connection. The setting only exists with LINEAR_SQLITE_PROFILE.
+    """
+    pragmas = getattr(settings, 'LINEAR_SQLITE_PRAGMAS', None)
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def pragmas(connection):
+    """
+    Current value of each LINEAR_SQLITE_PRAGMAS pragma on `connection`.
+    """
+    with connection.cursor() as cursor:
+        values = {}
+        for name in getattr(settings, 'LINEAR_SQLITE_PRAGMAS', {}):
+            cursor.execute(f"PRAGMA {name}")
+            values[name] = cursor.fetchone()[0]
+        return values
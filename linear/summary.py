@@ -0,0 +1,101 @@
+import hashlib
+import math
+from collections import Counter
+from urllib.parse import urlencode
+from django.conf import settings
+from django.contrib.admin.views.main import ALL_VAR, IS_FACETS_VAR, IS_POPUP_VAR, ORDER_VAR, PAGE_VAR, TO_FIELD_VAR
+from django.core.cache import cache
+from . import versions
+
+HOURLY_RATE = 250 * 10 ** 3
+OVERWORK_PREMIUM = 0.4
+
+VERSION = 'summary'
+# Parameters that change the page but not the filtered totals
+IGNORED_PARAMS = {ALL_VAR, IS_FACETS_VAR, IS_POPUP_VAR, ORDER_VAR, PAGE_VAR, TO_FIELD_VAR}
+
+_stats = Counter()
+
+
+def split_duration(duration):
+    """
+    Return (hours, minutes) of a duration, dropping the seconds.
+    """
+    hours, remainder = divmod(int(duration.total_seconds()), 3600)
+    return hours, remainder // 60
+
+
+def payroll_value(total_duration, total_overwork, hourly_rate=HOURLY_RATE, overwork_premium=OVERWORK_PREMIUM):
+    """
+    Pay for a total duration of which `total_overwork` is overwork: every
+    hour at `hourly_rate` plus `overwork_premium` on overwork hours,
+    counted in whole minutes.
+    """
+    hours, minutes = split_duration(total_duration)
+    ow_hours, ow_minutes = split_duration(total_overwork)
+    p = hourly_rate
+    return math.floor(((hours + minutes / 60 ) * p) + (ow_hours + ow_minutes / 60 ) * p * overwork_premium)
+
+
+def summary_context(total_duration, total_overwork, value=None):
+    """
+    The `total`, `total_overwork` and `total_value` shown above a changelist.
+    `value` defaults to the pay at the default rates.
+    """
+    if value is None:
+        value = payroll_value(total_duration, total_overwork)
+    hours, minutes = split_duration(total_duration)
+    ow_hours, ow_minutes = split_duration(total_overwork)
+    return {
+        'total': f"{hours}h {minutes}m",
+        'total_overwork': f"{ow_hours}h {ow_minutes}m",
+        'total_value': f"{value:,}",
+    }
+
+
+def cache_key(cl):
+    """
+    Key of a changelist's totals: its model and filter parameters, plus
+    the current version so every invalidation, in any process, starts a
+    fresh key space.
+    """
+    params = sorted(
+        (name, value)
+        for name, values in cl.params.items()
+        if name not in IGNORED_PARAMS
+        for value in (values if isinstance(values, list) else [values])
+    )
+    digest = hashlib.md5(urlencode(params).encode(), usedforsecurity=False).hexdigest()
+    return f"linear:summary:{versions.get(VERSION)}:{cl.opts.label_lower}:{digest}"
+
+
+def changelist_summary(cl, compute):
+    """
+    Summary context of a changelist, served from the cache when the same
+    filters were totalled since the last change to Work or Issue.
+    `compute(cl)` returns the total duration, total overwork and pay.
+    """
+    key = cache_key(cl)
+    context = cache.get(key)
+    if context is None:
+        _stats['misses'] += 1
+        context = summary_context(*compute(cl))
+        cache.set(key, context, settings.LINEAR_SUMMARY_CACHE_TIMEOUT)
+    else:
+        _stats['hits'] += 1
+    return context
+
+
+def invalidate():
+    """
+    Drop every cached summary, in every process, by moving to a new
+    version.
+    """
+    versions.bump(VERSION)
+
+
+def cache_stats():
+    """
+    Hit and miss counters of this process.
+    """
+    return {'hits': _stats['hits'], 'misses': _stats['misses']}
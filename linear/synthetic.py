@@ -0,0 +1,38 @@
+import random
+from datetime import datetime, timedelta
+from django.utils import timezone
+from .models import Issue, Work
+from . import ledger
+
+BATCH_SIZE = 1000
+
+
+def generate(works, issues=None, seed=0, start=None):
+    """
+    Create `works` synthetic Works spread over `issues` Issues (one per
+    fifty works by default), written with bulk_create.
+
+    Days hold several sessions with breaks in between; about a fifth of
+    them run past nine hours, some are flagged as overwork days and a few
+    sessions run past midnight. Returns the list of created Works.
+    """
+    rnd = random.Random(seed)
+    issues = Issue.objects.bulk_create(
+        Issue(title=f"synthetic {seed}-{i}") for i in range(issues or max(1, works // 50))
+    )
+    day = start or timezone.make_aware(datetime(2023, 3, 21, 8))
+    rows = []
+    while len(rows) < works:
+        long_day = rnd.random() < 0.2
+        overwork_day = rnd.random() < 0.05
+        cursor = day + timedelta(minutes=rnd.randint(0, 120))
+        for _ in range(min(rnd.randint(2, 8), works - len(rows))):
+            end = cursor + timedelta(minutes=rnd.randint(30, 180 if long_day else 90))
+            work = Work(issue=rnd.choice(issues), start=cursor, end=end, overwork_day=overwork_day)
+            work.set_work_date()
+            rows.append(work)
+            cursor = end + timedelta(minutes=rnd.randint(5, 60))
+        day += timedelta(days=1)
+    created = Work.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    ledger.refresh_works(created)
+    return created
@@ -1,3 +1,1357 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from io import BytesIO, StringIO
+from datetime import date, datetime, timedelta
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import F, Sum
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.dateparse import parse_duration
+from django.utils import timezone
+import numpy as np
+from openpyxl import load_workbook
+from tablib import Dataset
+from .actions import mark_as_overwork
+from .admin import WorkResource
+from .export import stream_csv
+from .models import CacheVersion, DailyLedger, Issue, Job, OverworkPolicy, PayrollRollup, Tombstone, Work
+from . import analytics, changes, instrumentation, jalali, jobs, ledger, overlaps, payroll, policy, routers, summary, timeseries, totals, views
+from .overwork import _day_candidates, compute_overwork, day_key, prefetch_overwork, summarize_days
 
-# Create your tests here.
+
+def local(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+def reference_overwork(work):
+    """
+    The original per-row overwork loop, kept as the reference the batch
+    engine is checked against.
+    """
+    if work.overwork_day:
+        return work.end - work.start
+    same_day_works = Work.objects.filter(
+        start__date=timezone.localtime(work.start).date(),
+        end__date=timezone.localtime(work.end).date()
+    ).order_by('start', 'id')
+    total_duration = timedelta()
+    for w in same_day_works:
+        total_duration += w.end - w.start
+    if total_duration <= timedelta(hours=9):
+        return timedelta()
+    running_total = timedelta()
+    for w in same_day_works:
+        if running_total + (w.end - w.start) > timedelta(hours=9):
+            nine_hour_mark = w.start + (timedelta(hours=9) - running_total)
+            break
+        running_total += w.end - w.start
+    if work.start >= nine_hour_mark:
+        return work.end - work.start
+    if work.end > nine_hour_mark:
+        return work.end - nine_hour_mark
+    return timedelta()
+
+
+def make_works(issue, days=20, seed=1):
+    """
+    Multi-session days, some long enough to go over nine hours, some
+    flagged as overwork days and some sessions running past midnight.
+    """
+    rnd = random.Random(seed)
+    works = []
+    for day in range(days):
+        cursor = local(2025, 3, 1, 7) + timedelta(days=day, minutes=rnd.randint(0, 90))
+        overwork_day = rnd.random() < 0.15
+        for _ in range(rnd.randint(1, 6)):
+            start = cursor + timedelta(minutes=rnd.randint(0, 45))
+            end = start + timedelta(minutes=rnd.randint(20, 240))
+            work = Work(issue=issue, start=start, end=end, overwork_day=overwork_day)
+            work.set_work_date()
+            works.append(work)
+            cursor = end
+    works = Work.objects.bulk_create(works)
+    # bulk_create skips the signals that maintain the ledger
+    ledger.refresh_works(works)
+    return works
+
+
+class OverworkEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.issue = Issue.objects.create(title="engine")
+        make_works(cls.issue)
+        # A session crossing midnight on a day that is already long
+        Work.objects.create(issue=cls.issue, start=local(2025, 4, 1, 8), end=local(2025, 4, 1, 18))
+        Work.objects.create(issue=cls.issue, start=local(2025, 4, 1, 20), end=local(2025, 4, 2, 2))
+        Work.objects.create(issue=cls.issue, start=local(2025, 4, 1, 23), end=local(2025, 4, 2, 9, 30))
+
+    def test_matches_reference_for_every_row(self):
+        works = list(Work.objects.all())
+        overwork = compute_overwork(works)
+        for work in works:
+            self.assertEqual(overwork[work.pk], reference_overwork(work), work.start)
+        self.assertTrue(any(overwork.values()))
+
+    def test_single_query_for_any_number_of_rows(self):
+        works = list(Work.objects.all())
+        with self.assertNumQueries(1):
+            prefetch_overwork(works)
+        with self.assertNumQueries(0):
+            for work in works:
+                work.overwork_duration
+
+    def test_reads_only_the_touched_days(self):
+        first, last = Work.objects.earliest('start'), Work.objects.latest('start')
+        # The days in between are not read
+        candidates = list(_day_candidates({day_key(first), day_key(last)}))
+        self.assertEqual(len(candidates), Work.objects.filter(work_date__in=(first.work_date, last.work_date)).count())
+        self.assertEqual(compute_overwork([first, last])[last.pk], reference_overwork(last))
+
+    def test_keys_resolve_the_time_zone_once(self):
+        works = list(Work.objects.all())
+        with mock.patch.object(timezone, 'get_current_timezone', wraps=timezone.get_current_timezone) as current:
+            compute_overwork(works)
+            list(summarize_days(works))
+        self.assertEqual(current.call_count, 2)
+        # The start day is the stored work_date
+        work = works[0]
+        work.work_date -= timedelta(days=1)
+        self.assertEqual(day_key(work)[0], work.work_date)
+
+    def test_property_matches_engine(self):
+        overwork = compute_overwork(Work.objects.all())
+        for work in Work.objects.all()[:15]:
+            self.assertEqual(work.overwork_duration, overwork[work.pk])
+
+
+class OverworkAnnotationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.issue = Issue.objects.create(title="annotation")
+        make_works(cls.issue, seed=2)
+        # Overlapping sessions: the second one lies entirely before the mark
+        Work.objects.create(issue=cls.issue, start=local(2025, 5, 1, 8), end=local(2025, 5, 1, 18))
+        Work.objects.create(issue=cls.issue, start=local(2025, 5, 1, 9), end=local(2025, 5, 1, 10))
+        Work.objects.create(issue=cls.issue, start=local(2025, 5, 1, 22), end=local(2025, 5, 2, 8))
+
+    def test_matches_python_engine(self):
+        expected = compute_overwork(Work.objects.all())
+        for work in Work.objects.with_overwork():
+            self.assertEqual(work.overwork_duration, expected[work.pk], work.start)
+
+    def test_total_in_one_query(self):
+        expected = sum(compute_overwork(Work.objects.all()).values(), timedelta())
+        with self.assertNumQueries(1):
+            total = Work.objects.with_overwork().aggregate(total=Sum('overwork_duration'))['total']
+        self.assertEqual(total, expected)
+
+    def test_filter_and_order_by_overwork(self):
+        works = Work.objects.with_overwork().filter(overwork_duration__gt=timedelta()).order_by('-overwork_duration')
+        durations = [w.overwork_duration for w in works]
+        self.assertTrue(durations)
+        self.assertEqual(durations, sorted(durations, reverse=True))
+
+
+class ChangelistSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="summary")
+        make_works(cls.issue, seed=3)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_work_changelist_totals(self):
+        expected = sum(compute_overwork(Work.objects.all()).values(), timedelta())
+        response = self.client.get('/admin/linear/work/')
+        self.assertEqual(response.status_code, 200)
+        hours, remainder = divmod(int(expected.total_seconds()), 3600)
+        self.assertEqual(response.context['total_overwork'], f"{hours}h {remainder // 60}m")
+        self.assertIn('total_value', response.context)
+
+    def test_work_changelist_overwork_filter_and_ordering(self):
+        response = self.client.get('/admin/linear/work/', {'overwork': 'yes', 'o': '5'})
+        self.assertEqual(response.status_code, 200)
+        rows = response.context['cl'].result_list
+        self.assertTrue(all(w.overwork_duration > timedelta() for w in rows))
+
+    def test_issue_changelist_totals(self):
+        expected = sum(compute_overwork(Work.objects.all()).values(), timedelta())
+        response = self.client.get('/admin/linear/issue/')
+        self.assertEqual(response.status_code, 200)
+        hours, remainder = divmod(int(expected.total_seconds()), 3600)
+        self.assertEqual(response.context['total_overwork'], f"{hours}h {remainder // 60}m")
+
+
+class DailyLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.issue = Issue.objects.create(title="ledger")
+        make_works(cls.issue, seed=4)
+
+    def test_ledger_matches_live_computation(self):
+        self.assertEqual(ledger.check(), [])
+        self.assertTrue(DailyLedger.objects.filter(overwork__gt=timedelta()).exists())
+
+    def test_save_move_and_delete_keep_ledger_in_sync(self):
+        work = Work.objects.create(issue=self.issue, start=local(2025, 3, 2, 18), end=local(2025, 3, 2, 23))
+        self.assertEqual(ledger.check(), [])
+        work.start, work.end = local(2025, 3, 5, 18), local(2025, 3, 5, 22)
+        work.save()
+        self.assertEqual(ledger.check(), [])
+        work.delete()
+        self.assertEqual(ledger.check(), [])
+
+    def test_refresh_upserts_and_drops_stale_rows(self):
+        row = DailyLedger.objects.order_by('day').first()
+        stale = DailyLedger.objects.create(day=row.day, end_day=row.day + timedelta(days=1))
+        ledger.refresh_days({row.day})
+        # The existing row is updated in place rather than deleted and inserted
+        self.assertEqual(DailyLedger.objects.get(day=row.day, end_day=row.end_day).pk, row.pk)
+        self.assertFalse(DailyLedger.objects.filter(pk=stale.pk).exists())
+        self.assertEqual(ledger.check(), [])
+
+    def test_failed_refresh_rolls_back_the_work(self):
+        with mock.patch.object(payroll, 'refresh', side_effect=RuntimeError("refresh failed")):
+            with self.assertRaises(RuntimeError):
+                Work.objects.create(issue=self.issue, start=local(2025, 3, 2, 18), end=local(2025, 3, 2, 23))
+        self.assertFalse(Work.objects.filter(start=local(2025, 3, 2, 18)).exists())
+        self.assertEqual((ledger.check(), payroll.check()), ([], []))
+
+    def test_mark_as_overwork_refreshes_ledger(self):
+        mark_as_overwork(None, None, Work.objects.filter(start__lt=local(2025, 3, 4)))
+        self.assertEqual(ledger.check(), [])
+
+    def test_deferred_refreshes_once(self):
+        with ledger.deferred():
+            for hour in (8, 12, 16):
+                Work.objects.create(issue=self.issue, start=local(2025, 6, 1, hour), end=local(2025, 6, 1, hour + 4))
+            self.assertFalse(DailyLedger.objects.filter(day=local(2025, 6, 1).date()).exists())
+        row = DailyLedger.objects.get(day=local(2025, 6, 1).date())
+        self.assertEqual(row.overwork, timedelta(hours=3))
+        self.assertEqual(ledger.check(), [])
+
+    def test_ledger_annotation_matches_window(self):
+        expected = {w.pk: w.overwork_duration for w in Work.objects.with_overwork()}
+        for work in Work.objects.with_ledger_overwork():
+            self.assertEqual(work.overwork_duration, expected[work.pk])
+
+    def test_rebuild_command(self):
+        DailyLedger.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_ledger', stdout=out)
+        self.assertIn("matches", out.getvalue())
+        DailyLedger.objects.update(overwork=timedelta())
+        with self.assertRaises(CommandError):
+            call_command('rebuild_ledger', '--check', stdout=StringIO())
+
+
+class IssueChangelistQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def add_issues(self, count, seed):
+        for i in range(count):
+            make_works(Issue.objects.create(title=f"issue {seed}-{i}"), days=3, seed=seed + i)
+
+    def test_query_count_does_not_grow_with_issues_or_works(self):
+        # session, user, count x2, page of issues, summary version, stored totals, pay
+        self.add_issues(2, seed=10)
+        with self.assertNumQueries(8):
+            response = self.client.get('/admin/linear/issue/')
+        self.assertEqual(response.status_code, 200)
+        self.add_issues(20, seed=100)
+        with self.assertNumQueries(8):
+            response = self.client.get('/admin/linear/issue/')
+        self.assertEqual(len(response.context['cl'].result_list), 22)
+
+    def test_duration_column_matches_model(self):
+        self.add_issues(3, seed=20)
+        response = self.client.get('/admin/linear/issue/', {'o': '2'})
+        for issue in response.context['cl'].result_list:
+            self.assertEqual(issue.total_duration, Issue.objects.get(pk=issue.pk).duration())
+        durations = [issue.total_duration for issue in response.context['cl'].result_list]
+        self.assertEqual(durations, sorted(durations))
+
+    def test_summary_is_rendered(self):
+        self.add_issues(2, seed=30)
+        response = self.client.get('/admin/linear/issue/')
+        self.assertContains(response, f'<div class="total-summary">Total Sum: <strong>{response.context["total"]}</strong></div>', html=True)
+        self.assertContains(response, f'<div class="total-value">Total Value: <strong>{response.context["total_value"]}</strong></div>', html=True)
+        # The import/export buttons are kept
+        self.assertContains(response, '/admin/linear/issue/import/')
+
+
+class StreamingExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="export")
+        make_works(cls.issue, days=5, seed=5)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def export(self, file_format):
+        data = {'format': file_format, 'resource': '0'}
+        for field in ('issue', 'start', 'end', 'overwork_duration', 'duration'):
+            data[f'workresource_{field}'] = 'on'
+        return self.client.post('/admin/linear/work/export/', data)
+
+    def test_csv_is_streamed_with_batch_overwork(self):
+        with CaptureQueriesContext(connection) as small:
+            b''.join(self.export('0').streaming_content)
+        make_works(self.issue, days=40, seed=6)
+        with CaptureQueriesContext(connection) as large:
+            response = self.export('0')
+            rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(rows[0], ['issue', 'start', 'end', 'overwork_duration', 'duration'])
+        self.assertEqual(len(rows) - 1, Work.objects.count())
+        expected = sum(compute_overwork(Work.objects.all()).values(), timedelta())
+        self.assertEqual(sum((parse_duration(row[3]) for row in rows[1:]), timedelta()), expected)
+
+    def test_xlsx_uses_write_only_workbook(self):
+        response = self.export('1')
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(rows[0], ('issue', 'start', 'end', 'overwork_duration', 'duration'))
+        self.assertEqual(len(rows) - 1, Work.objects.count())
+
+
+class BulkImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.issue = Issue.objects.create(title="existing")
+
+    def dataset(self, rows, titles=("existing", "new one", "another")):
+        data = Dataset(headers=['issue', 'start', 'end'])
+        for i in range(rows):
+            start = datetime(2025, 3, 1, 8) + timedelta(days=i // 4, hours=3 * (i % 4))
+            data.append([titles[i % len(titles)], start, start + timedelta(hours=3)])
+        return data
+
+    def test_query_count_does_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as small:
+            WorkResource().import_data(self.dataset(12), dry_run=True)
+        # 88 rows still fit in one SQLite INSERT of at most 999 parameters
+        with CaptureQueriesContext(connection) as large:
+            WorkResource().import_data(self.dataset(88), dry_run=True)
+        self.assertEqual(len(small), len(large))
+
+    def test_import_creates_missing_issues_and_keeps_ledger(self):
+        result = WorkResource().import_data(self.dataset(40))
+        self.assertFalse(result.has_errors())
+        self.assertEqual(Work.objects.count(), 40)
+        self.assertEqual(Issue.objects.count(), 3)
+        self.assertEqual(Work.objects.filter(issue=self.issue).count(), 14)
+        self.assertEqual(ledger.check(), [])
+
+    def test_dry_run_leaves_database_untouched(self):
+        result = WorkResource().import_data(self.dataset(8), dry_run=True)
+        self.assertFalse(result.has_errors())
+        self.assertEqual(result.totals['new'], 8)
+        self.assertEqual(Work.objects.count(), 0)
+        self.assertEqual(Issue.objects.count(), 1)
+
+    def test_invalid_rows_are_reported(self):
+        data = self.dataset(4)
+        data.append(["existing", "not a date", "2025-03-01 10:00"])
+        result = WorkResource().import_data(data, dry_run=True)
+        self.assertTrue(result.has_validation_errors())
+        self.assertEqual([row.number for row in result.invalid_rows], [5])
+
+
+class SummaryCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="cache")
+        make_works(cls.issue, days=5, seed=7)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def totals(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/linear/work/', params or {})
+        return response.context['total'], response.context['summary_cache'], len(queries)
+
+    def test_repeated_filters_hit_the_cache(self):
+        total, stats, first = self.totals({'month': '1403-12'})
+        again, stats_again, second = self.totals({'month': '1403-12', 'o': '3', 'p': '0'})
+        self.assertEqual(again, total)
+        self.assertEqual(stats_again['hits'], stats['hits'] + 1)
+        self.assertEqual(second, first - 1)
+
+    def test_other_filters_miss(self):
+        _, stats, _ = self.totals()
+        _, stats_again, _ = self.totals({'overwork': 'yes'})
+        self.assertEqual(stats_again['misses'], stats['misses'] + 1)
+
+    def test_changes_invalidate(self):
+        before, _, _ = self.totals()
+        Work.objects.create(issue=self.issue, start=local(2025, 7, 1, 8), end=local(2025, 7, 1, 10))
+        after, _, _ = self.totals()
+        self.assertNotEqual(after, before)
+        _, stats, _ = self.totals()
+        mark_as_overwork(None, None, Work.objects.all())
+        _, stats_again, _ = self.totals()
+        self.assertEqual(stats_again['misses'], stats['misses'] + 1)
+
+    def test_invalidation_from_another_process(self):
+        _, stats, _ = self.totals()
+        # A worker moves the version in the database, not in this cache
+        CacheVersion.objects.update_or_create(name=summary.VERSION, defaults={'version': 'worker'})
+        _, stats_again, _ = self.totals()
+        self.assertEqual(stats_again['misses'], stats['misses'] + 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN output checked against SQLite's query planner")
+class WorkIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.issue = Issue.objects.create(title="index")
+        make_works(cls.issue, days=3, seed=8)
+
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(f"USING INDEX {index}", queryset.explain())
+
+    def test_work_date_is_local_start_date(self):
+        work = Work.objects.create(issue=self.issue, start=local(2025, 8, 1, 1), end=local(2025, 8, 1, 2))
+        self.assertEqual(Work.objects.get(pk=work.pk).work_date, local(2025, 8, 1).date())
+        work.start = local(2025, 8, 2, 1)
+        work.save(update_fields=['start'])
+        self.assertEqual(Work.objects.get(pk=work.pk).work_date, local(2025, 8, 2).date())
+
+    def test_duration_is_stored(self):
+        work = Work.objects.create(issue=self.issue, start=local(2025, 8, 1, 1), end=local(2025, 8, 1, 2))
+        work.end = local(2025, 8, 1, 4)
+        work.save(update_fields=['end'])
+        self.assertEqual(Work.objects.get(pk=work.pk).duration, timedelta(hours=3))
+        self.assertFalse(Work.objects.exclude(duration=F('end') - F('start')).exists())
+
+    def test_day_lookups_use_work_date_index(self):
+        day = local(2025, 3, 1).date()
+        self.assertUsesIndex(Work.objects.filter(work_date=day).order_by('start'), 'work_date_start_idx')
+        self.assertUsesIndex(Work.objects.filter(work_date__in=[day]), 'work_date_start_idx')
+        self.assertUsesIndex(Work.objects.with_overwork().filter(pk=1), 'work_date_start_idx')
+
+    def test_month_and_issue_lookups_use_composite_indexes(self):
+        self.assertUsesIndex(Work.objects.filter(jalali_year=1403, jalali_month=12).order_by('start'), 'work_jalali_month_start_idx')
+        self.assertUsesIndex(Work.objects.filter(issue=self.issue).order_by('start'), 'work_issue_start_idx')
+
+    def test_overlap_lookups_use_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            overlaps.longest()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+            self.assertIn("INDEX linear_work_duration_", str(cursor.fetchall()))
+        work = Work.objects.first()
+        self.assertUsesIndex(
+            Work.objects.filter(start__gte=work.start - timedelta(hours=9), start__lt=work.end, end__gt=work.start),
+            'work_start_id_idx',
+        )
+
+
+class BenchLinearCommandTests(TestCase):
+    def test_reports_json_and_rolls_back(self):
+        out = StringIO()
+        call_command('bench_linear', '--sizes', '60', '--per-row-limit', '10', stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        results = report['sizes']['60']
+        for name in ('overwork_property', 'overwork_batch', 'analytics_load', 'analytics_compute',
+                     'work_changelist', 'issue_changelist',
+                     'issue_duration', 'export_dataset', 'export_csv_stream'):
+            self.assertEqual(set(results[name]) - {'rows'}, {'wall_time', 'queries', 'peak_memory'})
+        self.assertEqual(results['overwork_property']['queries'], 10)
+        self.assertEqual(results['overwork_batch']['queries'], 2)
+        self.assertFalse(Work.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+
+class LoadTestCommandTests(TransactionTestCase):
+    # The request threads use their own connections, so the seeded data
+    # must be committed
+    def test_reports_every_endpoint_and_cleans_up(self):
+        # A real work on the first seeded day survives the clean-up
+        kept = Work.objects.create(issue=Issue.objects.create(title="kept"), start=local(2023, 3, 21, 9), end=local(2023, 3, 21, 11))
+        out = StringIO()
+        # Every request is instrumented and logged
+        with self.assertLogs('linear.instrumentation'):
+            call_command('load_test', '--works', '60', '--concurrency', '2', '--requests', '4', stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['works'], 61)
+        self.assertEqual(len(report['endpoints']), 8)
+        for name, result in report['endpoints'].items():
+            self.assertEqual((name, result['requests'], result['errors']), (name, 4, 0))
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+            self.assertGreater(result['queries_mean'], 0)
+        self.assertEqual(list(Work.objects.all()), [kept])
+        self.assertEqual(list(Issue.objects.all()), [kept.issue])
+        self.assertFalse(User.objects.exists())
+        # No deletions reach the change feed, and the ledger is exact
+        self.assertFalse(Tombstone.objects.exists())
+        self.assertEqual(DailyLedger.objects.get().work_count, 1)
+        self.assertEqual((ledger.check(), payroll.check(), totals.check()), ([], [], []))
+
+
+class BenchConnectionsCommandTests(TestCase):
+    def test_reports_both_modes(self):
+        out = StringIO()
+        call_command('bench_connections', '--requests', '5', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual((report['requests'], report['pooled']), (5, False))
+        self.assertEqual([result['mode'] for result in report['results']], ['new_connection', 'persistent'])
+        for result in report['results']:
+            self.assertEqual(set(result), {'mode', 'mean_ms', 'p50_ms', 'p95_ms'})
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        make_works(Issue.objects.create(title="instrumented"), days=3, seed=9)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_off_by_default(self):
+        response = self.client.get('/admin/linear/work/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(LINEAR_INSTRUMENTATION_SAMPLE_RATE=1)
+    def test_sampled_request_gets_header_and_log_line(self):
+        with self.assertLogs('linear.instrumentation', 'INFO') as logs:
+            response = self.client.get('/admin/linear/work/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries, \d+ duplicates", summary;dur=')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/admin/linear/work/')
+        self.assertGreater(record['queries'], 0)
+        self.assertIn('summary', record['timings_ms'])
+
+    def test_duplicates_flag_n_plus_one(self):
+        issues = list(Issue.objects.all())
+        with instrumentation.instrument() as recorder:
+            for issue in issues * 3:
+                issue.duration()
+        self.assertEqual(recorder.query_count, 3)
+        self.assertEqual(recorder.duplicate_count, 2)
+        self.assertIsNotNone(recorder.as_dict()['top_duplicate'])
+
+
+class PayrollRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="payroll")
+        cls.other = Issue.objects.create(title="other")
+        make_works(cls.issue, seed=11)
+        make_works(cls.other, days=5, seed=12)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_rollups_match_live_computation(self):
+        self.assertEqual(payroll.check(), [])
+        self.assertTrue(PayrollRollup.objects.filter(overwork_duration__gt=timedelta()).exists())
+
+    def test_moving_and_deleting_works_keeps_rollups_in_sync(self):
+        work = Work.objects.filter(issue=self.issue).first()
+        # Into another issue and, 1 Farvardin 1404 being 2025-03-21, another month
+        work.issue, work.start, work.end = self.other, work.start + timedelta(days=40), work.end + timedelta(days=40)
+        work.save()
+        self.assertEqual((work.jalali_year, work.jalali_month, work.wage_month), (1404, 1, 'فروردین'))
+        self.assertEqual(payroll.check(), [])
+        work.delete()
+        self.assertEqual(payroll.check(), [])
+
+    def test_month_value_matches_work_changelist(self):
+        response = self.client.get('/admin/linear/work/', {'month': '1403-12'})
+        report = self.client.get('/linear/payroll/1403/12/').json()
+        self.assertEqual(f"{report['value']:,}", response.context['total_value'])
+        self.assertEqual({row['title'] for row in report['issues']}, {"payroll", "other"})
+
+    def test_month_list_and_admin_view(self):
+        report = self.client.get('/linear/payroll/').json()
+        self.assertEqual([(month['jalali_year'], month['jalali_month'], month['wage_month']) for month in report['months']],
+                         [(1403, 12, 'اسفند')])
+        self.assertEqual(self.client.get('/admin/linear/payrollrollup/').status_code, 200)
+        self.assertEqual(self.client.get('/linear/payroll/1404/4/').status_code, 404)
+
+    def test_rebuild_command(self):
+        PayrollRollup.objects.all().delete()
+        call_command('rebuild_payroll', stdout=StringIO())
+        self.assertEqual(payroll.check(), [])
+
+
+class ReportingApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="api")
+        cls.other = Issue.objects.create(title="other")
+        make_works(cls.issue, seed=13)
+        make_works(cls.other, days=3, seed=14)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def pages(self, url, **params):
+        results, cursor = [], None
+        while True:
+            page = self.client.get(url, {**params, **({'cursor': cursor} if cursor else {})}).json()
+            results += page['results']
+            cursor = page['next']
+            if cursor is None:
+                return results
+
+    def test_works_keyset_pagination_covers_every_row_once(self):
+        works = self.pages('/linear/api/works/', limit=7)
+        expected = list(Work.objects.order_by('start', 'id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in works], expected)
+        overwork = {w.pk: w.overwork_duration for w in Work.objects.with_ledger_overwork()}
+        self.assertEqual({row['id']: row['overwork_duration'] for row in works},
+                         {pk: round(td.total_seconds() / 3600, 2) for pk, td in overwork.items()})
+
+    def test_works_page_query_count_does_not_grow_with_depth(self):
+        first = self.client.get('/linear/api/works/', {'limit': 5, 'issue': self.issue.pk}).json()
+        with CaptureQueriesContext(connection) as shallow:
+            self.client.get('/linear/api/works/', {'limit': 5, 'cursor': first['next']})
+        last = Work.objects.order_by('start', 'id')[Work.objects.count() - 3]
+        cursor = views.encode_cursor(last.start.isoformat(), last.pk)
+        with CaptureQueriesContext(connection) as deep:
+            page = self.client.get('/linear/api/works/', {'limit': 5, 'cursor': cursor}).json()
+        self.assertEqual(len(shallow), len(deep))
+        self.assertEqual(len(page['results']), 2)
+        self.assertIsNone(page['next'])
+
+    def test_fields_filters_and_errors(self):
+        page = self.client.get('/linear/api/works/', {'fields': 'id,start', 'issue': self.other.pk}).json()
+        self.assertEqual(set(page['results'][0]), {'id', 'start'})
+        self.assertEqual(len(page['results']), Work.objects.filter(issue=self.other).count())
+        self.assertEqual(self.client.get('/linear/api/works/', {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get('/linear/api/works/', {'cursor': 'nonsense'}).status_code, 400)
+        self.assertEqual(self.client.get('/linear/api/works/', {'limit': 'all'}).status_code, 400)
+
+    def test_malformed_parameters_are_bad_requests(self):
+        bad = [{'issue': 'abc'}, {'issue': str(2 ** 70)}, {'jalali_year': '14o4'}, {'jalali_month': 'zz'},
+               {'date_from': 'garbage'}, {'date_to': '2025-13-01'}]
+        for url in ('/linear/api/works/', '/linear/api/summary/'):
+            for params in bad:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400, (url, params))
+                self.assertIn('error', response.json())
+        for url in ('/linear/api/days/', '/linear/api/summary/days/'):
+            for params in ({'date_from': 'garbage'}, {'date_to': 'x'}):
+                self.assertEqual(self.client.get(url, params).status_code, 400, (url, params))
+        for cursor in ('MQ==', views.encode_cursor('not a date', 1), views.encode_cursor('2025-03-01', 'x'),
+                       views.encode_cursor({'a': 1}, 1)):
+            self.assertEqual(self.client.get('/linear/api/works/', {'cursor': cursor}).status_code, 400, cursor)
+        self.assertEqual(self.client.get('/linear/api/days/', {'cursor': views.encode_cursor('x', 1)}).status_code, 400)
+        self.assertEqual(self.client.get('/linear/api/issues/', {'cursor': views.encode_cursor([1])}).status_code, 400)
+
+    def test_issues_days_and_months(self):
+        issues = self.pages('/linear/api/issues/', limit=1)
+        self.assertEqual([row['title'] for row in issues], ["api", "other"])
+        self.assertEqual(sum(row['work_count'] for row in issues), Work.objects.count())
+        days = self.pages('/linear/api/days/', limit=4)
+        self.assertEqual(len(days), DailyLedger.objects.count())
+        months = self.client.get('/linear/api/months/').json()['results']
+        self.assertEqual([month['wage_month'] for month in months], ['اسفند'])
+
+    def test_conditional_get(self):
+        response = self.client.get('/linear/api/days/')
+        self.assertTrue(response.has_header('ETag'))
+        cached = self.client.get('/linear/api/days/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.client.logout()
+        self.assertEqual(self.client.get('/linear/api/days/').status_code, 302)
+
+
+class AsyncSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="async")
+        cls.other = Issue.objects.create(title="other")
+        make_works(cls.issue, seed=15)
+        make_works(cls.other, days=4, seed=16)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    async def test_summary_matches_work_changelist(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/linear/api/summary/', {'issue': self.issue.pk})
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        changelist = await sync_to_async(self.client.get)('/admin/linear/work/', {'issue__id__exact': self.issue.pk})
+        self.assertEqual(report['works']['total_value'], changelist.context['total_value'])
+        self.assertEqual(report['works']['work_count'], await Work.objects.filter(issue=self.issue).acount())
+        self.assertEqual(report['issue_count'], 1)
+        self.assertEqual(report['days']['day_count'], await DailyLedger.objects.acount())
+
+    async def test_day_report(self):
+        await self.async_client.aforce_login(self.user)
+        day = await DailyLedger.objects.order_by('day').afirst()
+        report = (await self.async_client.get('/linear/api/summary/days/', {'date_to': day.day})).json()
+        self.assertEqual([row['day'] for row in report['results']], [day.day.isoformat()])
+        self.assertEqual(report['totals']['work_count'], day.work_count)
+
+    @override_settings(LINEAR_INSTRUMENTATION_SAMPLE_RATE=1)
+    async def test_instrumented_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        with self.assertLogs('linear.instrumentation') as logs:
+            response = await self.async_client.get('/linear/api/summary/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertGreater(json.loads(logs.records[0].getMessage())['queries'], 0)
+
+    async def test_requires_staff(self):
+        response = await self.async_client.get('/linear/api/summary/')
+        self.assertEqual(response.status_code, 302)
+
+
+class AnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.issue = Issue.objects.create(title="analytics")
+        cls.other = Issue.objects.create(title="other")
+        # Both issues span Esfand 1403 and Farvardin 1404
+        make_works(cls.issue, days=30, seed=17)
+        make_works(cls.other, days=30, seed=18)
+
+    def test_overwork_matches_property(self):
+        works = analytics.load()
+        overwork = dict(zip(works.ids.tolist(), analytics.overwork(works).tolist()))
+        expected = compute_overwork(Work.objects.all())
+        self.assertEqual({pk: timedelta(microseconds=value) for pk, value in overwork.items()}, expected)
+
+    def test_daily_totals_match_summarize_days(self):
+        totals = analytics.daily_totals(analytics.load())
+        expected = list(summarize_days(Work.objects.all()))
+        self.assertEqual(totals['day'].tolist(), [day['day'] for day in expected])
+        self.assertEqual(totals['end_day'].tolist(), [day['end_day'] for day in expected])
+        self.assertEqual(totals['work_count'].tolist(), [day['work_count'] for day in expected])
+        self.assertEqual(
+            [timedelta(microseconds=value) for value in totals['overwork'].tolist()],
+            [day['overwork'] for day in expected],
+        )
+        self.assertEqual(
+            [None if mark == analytics.NO_MARK else analytics.EPOCH + timedelta(microseconds=mark)
+             for mark in totals['nine_hour_mark'].tolist()],
+            [day['nine_hour_mark'] for day in expected],
+        )
+
+    def test_payroll_matches_rollups(self):
+        rows = analytics.payroll(analytics.load())
+        self.assertEqual(len(rows), 4)
+        stored = {(r.jalali_year, r.jalali_month, r.issue_id, r.policy_from): (r.regular_duration, r.overwork_duration, r.value)
+                  for r in PayrollRollup.objects.all()}
+        self.assertEqual(
+            {(r['jalali_year'], r['jalali_month'], r['issue_id'], r['policy_from']):
+             (r['regular_duration'], r['overwork_duration'], r['value']) for r in rows},
+            stored,
+        )
+
+    def test_local_days_follow_historic_offsets(self):
+        # Tehran observed +04:30 in the summer of 2021
+        stamps = [local(2021, 6, 1, 23, 50), local(2021, 6, 2, 0, 10), local(2022, 6, 1, 23, 50), local(2024, 1, 1, 0, 0)]
+        days = analytics.local_days(np.array([analytics.microseconds(s - analytics.EPOCH) for s in stamps]))
+        self.assertEqual(days.astype('datetime64[D]').tolist(), [timezone.localtime(s).date() for s in stamps])
+
+    def test_empty(self):
+        works = analytics.load(Work.objects.none())
+        self.assertEqual(len(works), 0)
+        self.assertEqual(analytics.overwork(works).tolist(), [])
+        self.assertEqual(analytics.daily_totals(works)['work_count'].tolist(), [])
+        self.assertEqual(analytics.payroll(works), [])
+
+
+class OverworkPolicyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="policy")
+        make_works(cls.issue, days=20, seed=19)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        # The rollback removes the policies without a signal
+        policy.invalidate()
+
+    def add_policy(self):
+        return OverworkPolicy.objects.create(
+            valid_from=date(2025, 3, 11), threshold=timedelta(hours=7), hourly_rate=300000, overwork_premium=0.5,
+        )
+
+    def test_table_lookup(self):
+        table = policy.PolicyTable([
+            policy.Policy(date(2025, 3, 1), timedelta(hours=8), 1, 0.1),
+            policy.Policy(date(2025, 2, 1), timedelta(hours=7), 2, 0.2),
+        ])
+        self.assertEqual(table.for_day(date(2025, 1, 31)), policy.DEFAULT)
+        self.assertEqual(table.for_day(date(2025, 2, 1)).hourly_rate, 2)
+        self.assertEqual(table.for_day(date(2025, 2, 28)).hourly_rate, 2)
+        self.assertEqual(table.for_day(date(2025, 3, 1)).hourly_rate, 1)
+        self.assertEqual(table.period(None), policy.DEFAULT)
+
+    def test_policy_change_recomputes_overwork(self):
+        before = compute_overwork(Work.objects.all())
+        self.add_policy()
+        self.assertEqual(policy.table().for_day(date(2025, 3, 11)).threshold, timedelta(hours=7))
+        after = compute_overwork(Work.objects.all())
+        self.assertNotEqual(before, after)
+        for work in Work.objects.all():
+            threshold = timedelta(hours=7) if work.work_date >= date(2025, 3, 11) else timedelta(hours=9)
+            self.assertEqual(after[work.pk], compute_overwork([work], threshold)[work.pk])
+        self.assertEqual({w.pk: w.overwork_duration for w in Work.objects.with_overwork()}, after)
+        self.assertEqual({w.pk: w.overwork_duration for w in Work.objects.with_ledger_overwork()}, after)
+        self.assertEqual(ledger.check(), [])
+
+        OverworkPolicy.objects.get().delete()
+        self.assertEqual(compute_overwork(Work.objects.all()), before)
+        self.assertEqual(ledger.check(), [])
+
+    def test_change_from_another_process_is_picked_up(self):
+        self.assertEqual(len(policy.table()), 0)
+        # Written the way another process would, with no signal here
+        OverworkPolicy.objects.bulk_create([OverworkPolicy(valid_from=date(2025, 3, 11), updated_at=timezone.now())])
+        with self.assertNumQueries(0):
+            self.assertEqual(len(policy.table()), 0)
+        with override_settings(LINEAR_POLICY_CHECK_SECONDS=0):
+            self.assertEqual(len(policy.table()), 1)
+            with self.assertNumQueries(1):
+                policy.table()
+            OverworkPolicy.objects.filter(valid_from=date(2025, 3, 11)).update(
+                hourly_rate=1, updated_at=timezone.now() + timedelta(seconds=1),
+            )
+            self.assertEqual(policy.table().for_day(date(2025, 3, 11)).hourly_rate, 1)
+
+    def test_pay_per_period(self):
+        self.add_policy()
+        self.assertEqual(payroll.check(), [])
+        self.assertEqual(set(PayrollRollup.objects.values_list('policy_from', flat=True)), {None, date(2025, 3, 11)})
+        def value(works, *rates):
+            totals = works.with_ledger_overwork().aggregate(
+                total=Sum(F('end') - F('start')), overwork=Sum('overwork_duration'),
+            )
+            return summary.payroll_value(totals['total'], totals['overwork'], *rates)
+
+        expected = (value(Work.objects.filter(work_date__lt=date(2025, 3, 11)))
+                    + value(Work.objects.filter(work_date__gte=date(2025, 3, 11)), 300000, 0.5))
+        response = self.client.get('/admin/linear/work/')
+        self.assertEqual(response.context['total_value'], f"{expected:,}")
+        self.assertEqual(self.client.get('/linear/payroll/1403/12/').json()['value'], expected)
+        self.assertEqual(sum(row['value'] for row in analytics.payroll(analytics.load())),
+                         sum(PayrollRollup.objects.values_list('value', flat=True)))
+
+
+class OverlapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="overlap")
+        cls.long = Work.objects.create(issue=cls.issue, start=local(2025, 6, 1, 8), end=local(2025, 6, 1, 18))
+        cls.nested = Work.objects.create(issue=cls.issue, start=local(2025, 6, 1, 9), end=local(2025, 6, 1, 10))
+        cls.hidden = Work.objects.create(issue=cls.issue, start=local(2025, 6, 1, 11), end=local(2025, 6, 1, 12))
+        cls.clear = Work.objects.create(issue=cls.issue, start=local(2025, 6, 2, 8), end=local(2025, 6, 2, 9))
+        cls.touching = Work.objects.create(issue=cls.issue, start=local(2025, 6, 2, 9), end=local(2025, 6, 2, 10))
+
+    def test_sweep_finds_nested_overlaps(self):
+        self.assertEqual(overlaps.scan(), [
+            (self.nested.pk, self.long.pk, timedelta(hours=1)),
+            (self.hidden.pk, self.long.pk, timedelta(hours=1)),
+        ])
+
+    def test_validation(self):
+        work = Work(issue=self.issue, start=local(2025, 6, 2, 8, 30), end=local(2025, 6, 2, 11))
+        with self.assertNumQueries(2):
+            found = overlaps.conflicts(work)
+        # Bounded by the longest work, read from the duration index
+        self.assertEqual(overlaps.longest(), timedelta(hours=10))
+        self.assertEqual(found, [self.clear, self.touching])
+        with self.assertRaisesMessage(ValidationError, f"#{self.clear.pk}"):
+            work.full_clean()
+        Work(issue=self.issue, start=local(2025, 6, 2, 10), end=local(2025, 6, 2, 11)).full_clean()
+        self.touching.full_clean()
+
+    def inline_data(self, starts=None):
+        works = list(self.issue.works.order_by('pk'))
+        data = {'title': "renamed", 'works-TOTAL_FORMS': len(works), 'works-INITIAL_FORMS': len(works),
+                'works-MIN_NUM_FORMS': 0, 'works-MAX_NUM_FORMS': 1000}
+        for i, work in enumerate(works):
+            start, end = timezone.localtime((starts or {}).get(work.pk, work.start)), timezone.localtime(work.end)
+            data.update({
+                f'works-{i}-id': work.pk, f'works-{i}-issue': self.issue.pk, f'works-{i}-description': "",
+                f'works-{i}-start_0': start.date(), f'works-{i}-start_1': start.time(),
+                f'works-{i}-end_0': end.date(), f'works-{i}-end_1': end.time(),
+            })
+        return data
+
+    def test_issue_with_stored_overlaps_can_be_saved(self):
+        self.client.force_login(self.user)
+        url = f'/admin/linear/issue/{self.issue.pk}/change/'
+        response = self.client.post(url, self.inline_data())
+        self.assertEqual(response.status_code, 302, response.context and response.context['errors'])
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.title, "renamed")
+        # A work that is moved is still checked
+        response = self.client.post(url, self.inline_data({self.touching.pk: local(2025, 6, 2, 8, 30)}))
+        self.assertContains(response, f"This work overlaps #{self.clear.pk}")
+
+    def test_scan_command(self):
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, "2 overlapping works found."):
+            call_command('scan_overlaps', stdout=out)
+        self.assertIn(f"work {self.hidden.pk} overlaps work {self.long.pk}", out.getvalue())
+
+    def test_admin_filter(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/admin/linear/work/', {'overlap': 'yes'})
+        self.assertEqual({w.pk for w in response.context['cl'].result_list}, {self.long.pk, self.nested.pk, self.hidden.pk})
+        response = self.client.get('/admin/linear/work/', {'overlap': 'no'})
+        self.assertEqual({w.pk for w in response.context['cl'].result_list}, {self.clear.pk, self.touching.pk})
+
+
+@skipUnless(connection.vendor == 'sqlite', "Runs the SQLite performance profile")
+class SQLiteProfileTests(SimpleTestCase):
+    def test_router_only_routes_reads_blocks(self):
+        router = routers.ReportReadRouter()
+        with override_settings(LINEAR_READ_DATABASE='default'):
+            self.assertIsNone(router.db_for_read(Work))
+            with routers.reads():
+                self.assertEqual(router.db_for_read(Work), 'default')
+            self.assertFalse(router.allow_migrate('default', 'linear'))
+        with routers.reads():
+            # No read database configured
+            self.assertIsNone(router.db_for_read(Work))
+
+    def test_concurrent_imports_and_reports(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = {**os.environ, 'LINEAR_SQLITE_PROFILE': 'True', 'SQLITE_PATH': os.path.join(directory, 'db.sqlite3')}
+            manage = [sys.executable, str(settings.BASE_DIR / 'manage.py')]
+            subprocess.run([*manage, 'migrate', '-v0'], env=env, check=True)
+            run = subprocess.run(
+                [*manage, 'sqlite_concurrency', '--importers', '2', '--readers', '3', '--rounds', '2', '--rows', '30'],
+                env=env, capture_output=True, text=True,
+            )
+            with sqlite3.connect(env['SQLITE_PATH']) as db:
+                # The clean-up leaves no rows, ledger days or Tombstones behind
+                left = [db.execute(f"SELECT COUNT(*) FROM {model._meta.db_table}").fetchone()[0]
+                        for model in (Work, Issue, DailyLedger, Tombstone)]
+        self.assertEqual(run.returncode, 0, run.stderr)
+        self.assertEqual(left, [0, 0, 0, 0])
+        report = json.loads(run.stdout)
+        self.assertEqual(report['pragmas']['journal_mode'], 'wal')
+        self.assertTrue(report['read_database'])
+        self.assertEqual(report['imports']['count'], 4)
+        self.assertEqual(report['reports']['count'], 12)
+
+
+class ProductionProfileTests(SimpleTestCase):
+    def test_parse_importtime_sums_top_level_modules(self):
+        from .management.commands.profile_startup import parse_importtime
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       100 |        100 |   encodings.idna\n"
+            "import time:       200 |        300 | encodings\n"
+            "import time:        50 |         50 | json\n"
+        )
+        self.assertEqual(parse_importtime(output), {'encodings': 300, 'json': 50})
+
+    def test_worker_skips_import_export_until_the_admin_loads(self):
+        code = (
+            "import sys, django; django.setup(); from linear import jobs; "
+            "from django.conf import settings; from django.contrib.admin import site; "
+            "print(settings.DEBUG, 'openpyxl' in sys.modules, 'import_export.admin' in sys.modules, len(site._registry)); "
+            "from django.urls import get_resolver; get_resolver().url_patterns; "
+            "print('import_export.admin' in sys.modules, len(site._registry) > 0)"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'WorkDjango.settings', 'LINEAR_PRODUCTION_PROFILE': 'True'}
+        run = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        self.assertEqual(run.returncode, 0, run.stderr)
+        self.assertEqual(run.stdout.split(), ['False', 'False', 'False', '0', 'True', 'True'])
+
+    def test_profile_startup_reports_every_run(self):
+        out = StringIO()
+        call_command('profile_startup', '--scenarios', 'worker', '--repeat', '1', '--top', '3', stdout=out, stderr=StringIO())
+        results = json.loads(out.getvalue())['results']
+        self.assertEqual(set(results), {'worker/default', 'worker/production'})
+        self.assertIn('import_export.admin', results['worker/default']['top_imports_ms'])
+        self.assertNotIn('import_export.admin', results['worker/production']['top_imports_ms'])
+        self.assertGreater(results['worker/production']['import_ms'], 0)
+
+
+class JobQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="queued")
+        cls.works = make_works(cls.issue, days=4, seed=19)
+        make_works(Issue.objects.create(title="other"), days=2, seed=20)
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.force_login(self.user)
+
+    def work(self, *args):
+        out = StringIO()
+        call_command('run_linear_worker', '--processes', '0', '--once', *args, stdout=out)
+        return out.getvalue()
+
+    def test_claim_runs_each_job_once(self):
+        first = jobs.enqueue(Job.REBUILD_PAYROLL)
+        second = jobs.enqueue(Job.REBUILD_LEDGER)
+        self.assertEqual(jobs.claim(), first.pk)
+        self.assertEqual(jobs.claim(), second.pk)
+        self.assertIsNone(jobs.claim())
+
+    def test_background_export_of_admin_selection(self):
+        selected = self.works[:5]
+        response = self.client.post('/admin/linear/work/', {
+            'action': 'export_csv_in_background', '_selected_action': [w.pk for w in selected],
+        })
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get()
+        self.assertEqual((job.kind, job.status, job.created_by), (Job.EXPORT_WORKS, Job.QUEUED, self.user))
+
+        self.assertIn(f"job {job.pk} done", self.work())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        status = self.client.get(f'/admin/linear/job/{job.pk}/status/').json()
+        self.assertEqual(status['status'], Job.DONE)
+
+        response = self.client.get(status['download'])
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), len(selected))
+        self.assertEqual(
+            sum((parse_duration(row['duration']) for row in rows), timedelta()),
+            sum((w.end - w.start for w in selected), timedelta()),
+        )
+
+    def test_filtered_selection_is_rebuilt(self):
+        month = f"{self.works[0].jalali_year}-{self.works[0].jalali_month:02d}"
+        self.client.post(f'/admin/linear/work/?month={month}&overwork=yes', {
+            'action': 'export_csv_in_background', '_selected_action': [0], 'select_across': '1',
+        })
+        job = Job.objects.get()
+        self.assertEqual(job.params, {'format': 'csv', 'filters': f'month={month}&overwork=yes', 'ids': None})
+        expected = Work.objects.with_ledger_overwork().filter(
+            jalali_year=self.works[0].jalali_year, jalali_month=self.works[0].jalali_month, overwork_duration__gt=timedelta(),
+        )
+        self.assertEqual(set(jobs.job_queryset(job, Work).values_list('pk', flat=True)), {w.pk for w in expected})
+
+    def test_xlsx_issue_export(self):
+        job = jobs.enqueue(Job.EXPORT_ISSUES, self.user, format='xlsx', filters='', ids=[self.issue.pk])
+        self.work()
+        job.refresh_from_db()
+        sheet = load_workbook(job.result.open('rb')).active
+        self.assertEqual([row[1] for row in sheet.iter_rows(min_row=2, values_only=True)], ["queued"])
+
+    def test_rebuild_from_admin(self):
+        PayrollRollup.objects.all().delete()
+        self.client.post('/admin/linear/job/add/', {'kind': Job.REBUILD_LEDGER})
+        self.work()
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.DONE, job.message)
+        self.assertTrue(PayrollRollup.objects.exists())
+        self.assertIsNone(self.client.get(f'/admin/linear/job/{job.pk}/status/').json()['download'])
+
+    def test_failure_is_recorded(self):
+        job = jobs.enqueue(Job.EXPORT_WORKS, self.user, format='csv', filters='start__bogus=1', ids=None)
+        with self.assertLogs('linear.jobs', 'ERROR'):
+            self.assertIn("failed", self.work())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("IncorrectLookupParameters", job.message)
+        self.assertEqual(self.client.get(f'/admin/linear/job/{job.pk}/download/').status_code, 404)
+
+    def test_changelist_refreshes_while_pending(self):
+        jobs.enqueue(Job.REBUILD_PAYROLL)
+        self.assertContains(self.client.get('/admin/linear/job/'), 'http-equiv="refresh"')
+        self.work()
+        self.assertNotContains(self.client.get('/admin/linear/job/'), 'http-equiv="refresh"')
+
+    def test_job_of_a_lost_worker_is_requeued(self):
+        job = jobs.enqueue(Job.REBUILD_PAYROLL)
+        self.assertEqual(jobs.claim(), job.pk)
+        self.assertContains(self.client.get('/admin/linear/job/'), 'http-equiv="refresh"')
+        # The worker was killed; its heartbeat stopped past the lease
+        expired = timezone.now() - timedelta(seconds=settings.LINEAR_JOB_LEASE_SECONDS + 1)
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=expired)
+        self.assertNotContains(self.client.get('/admin/linear/job/'), 'http-equiv="refresh"')
+
+        with self.assertLogs('linear.jobs', 'WARNING'):
+            self.assertEqual(jobs.claim(), job.pk)
+        # The lost attempt can no longer record an outcome
+        jobs.finish(job.pk, Job.FAILED, "late", attempt=1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.RUNNING, 2))
+
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=expired, attempts=settings.LINEAR_JOB_MAX_ATTEMPTS)
+        with self.assertLogs('linear.jobs', 'WARNING'):
+            self.assertIsNone(jobs.claim())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+
+class IssueTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="totals")
+        cls.other = Issue.objects.create(title="other")
+        make_works(cls.issue, days=6, seed=31)
+        make_works(cls.other, days=6, seed=32)
+
+    def assertInSync(self):
+        self.assertEqual(totals.check(), [])
+
+    def test_kept_in_sync_by_work_changes(self):
+        self.assertInSync()
+        work = Work.objects.create(issue=self.issue, start=local(2025, 3, 2, 20), end=local(2025, 3, 2, 23))
+        self.assertInSync()
+        work.issue = self.other
+        work.save()
+        self.assertInSync()
+        work.delete()
+        self.assertInSync()
+        self.issue.refresh_from_db()
+        self.assertEqual(self.issue.total_duration, self.issue.duration())
+        self.assertEqual(self.issue.work_count, self.issue.works.count())
+
+    def test_bulk_update_and_stale_issue_save(self):
+        stale = Issue.objects.get(pk=self.issue.pk)
+        mark_as_overwork(None, None, Work.objects.filter(issue=self.issue))
+        self.assertInSync()
+        stale.title = "renamed"
+        stale.save()
+        self.assertInSync()
+        self.assertEqual(Issue.objects.get(pk=self.issue.pk).total_overwork, self.issue.duration())
+
+    def test_reconcile_repairs_drift(self):
+        Issue.objects.filter(pk=self.issue.pk).update(work_count=0, total_overwork=timedelta())
+        with self.assertRaises(CommandError):
+            call_command('reconcile_issue_totals', '--check', stdout=StringIO())
+        out = StringIO()
+        call_command('reconcile_issue_totals', stdout=out)
+        self.assertIn("Repaired the totals of 1 issues.", out.getvalue())
+        self.assertInSync()
+
+    def test_changelist_sorts_and_filters_on_stored_totals(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        response = self.client.get('/admin/linear/issue/', {'o': '3'})
+        overwork = [issue.total_overwork for issue in response.context['cl'].result_list]
+        self.assertEqual(overwork, sorted(overwork))
+        response = self.client.get('/admin/linear/issue/', {'overwork': 'no'})
+        self.assertEqual(list(response.context['cl'].result_list), list(Issue.objects.filter(total_overwork=timedelta())))
+
+
+class TimeSeriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="series")
+        make_works(cls.issue, days=40, seed=41)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def expected(self, kind):
+        totals = {}
+        overwork = compute_overwork(Work.objects.all())
+        for work in Work.objects.all():
+            start = timeseries.bucket_start(kind, timezone.localtime(work.start).date())
+            total, ow, count = totals.get(start, timeseries.EMPTY)
+            totals[start] = (total + work.end - work.start, ow + overwork[work.pk], count + 1)
+        return totals
+
+    def test_buckets_match_per_work_totals(self):
+        for kind in ('day', 'week', 'month'):
+            series = timeseries.series(kind, date(2025, 2, 20), date(2025, 4, 20))
+            self.assertEqual({start: tuple(rest) for start, *rest in series if rest[2]}, self.expected(kind))
+            self.assertEqual([start for start, *_ in series], sorted(start for start, *_ in series))
+
+    def test_only_touched_buckets_are_recomputed(self):
+        timeseries.series('week', date(2025, 3, 1), date(2025, 4, 10))
+        # Only the versions are read once the buckets are cached
+        with self.assertNumQueries(2):
+            timeseries.series('week', date(2025, 3, 1), date(2025, 4, 10))
+        Work.objects.create(issue=self.issue, start=local(2025, 3, 12, 22), end=local(2025, 3, 12, 23))
+        with CaptureQueriesContext(connection) as queries:
+            series = timeseries.series('week', date(2025, 3, 1), date(2025, 4, 10))
+        self.assertEqual(len(queries), 3)
+        # One week bucket is missing, so the recompute covers only that week
+        self.assertIn('2025-03-10', queries[2]['sql'])
+        self.assertIn('2025-03-16', queries[2]['sql'])
+        self.assertEqual({start: tuple(rest) for start, *rest in series if rest[2]}, self.expected('week'))
+
+    def test_endpoint_and_admin_page(self):
+        response = self.client.get('/linear/api/timeseries/', {'bucket': 'month', 'date_from': '2025-03-01', 'date_to': '2025-04-30'})
+        results = response.json()['results']
+        self.assertEqual([row['start'] for row in results], ['2025-03-01', '2025-04-01'])
+        self.assertEqual(sum(row['work_count'] for row in results), Work.objects.count())
+        self.assertEqual(self.client.get('/linear/api/timeseries/', {'bucket': 'year'}).status_code, 400)
+
+        changelist = self.client.get('/admin/linear/work/')
+        self.assertContains(changelist, '<a href="/admin/linear/work/calendar/">Hours calendar</a>', html=True)
+        self.assertContains(changelist, 'Import')
+
+        response = self.client.get('/admin/linear/work/calendar/', {'date_from': '2025-03-01', 'date_to': '2025-04-09', 'bucket': 'week'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['heatmap']), 7)
+        self.assertEqual(len(response.context['series']), 7)
+        self.assertContains(response, 'class="level-4"')
+
+
+class JalaliTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="jalali")
+        # 2025-03-01 to 2025-04-04: Esfand 1403 and Farvardin 1404
+        make_works(cls.issue, days=35, seed=23)
+
+    def test_conversion(self):
+        self.assertEqual(jalali.from_gregorian(date(2025, 3, 20)), (1403, 12, 30))
+        self.assertEqual(jalali.from_gregorian(date(2025, 3, 21)), (1404, 1, 1))
+        self.assertEqual(jalali.from_gregorian(date(2023, 10, 18)), (1402, 7, 26))
+        self.assertEqual(jalali.from_gregorian(date(1979, 2, 11)), (1357, 11, 22))
+        self.assertEqual([jalali.is_leap(year) for year in (1399, 1403, 1404, 1408)], [True, True, False, True])
+        day = date(2000, 1, 1)
+        while day < date(2040, 1, 1):
+            self.assertEqual(jalali.to_gregorian(*jalali.from_gregorian(day)), day)
+            day += timedelta(days=1)
+
+    def test_month_is_derived_from_start(self):
+        work = Work.objects.create(issue=self.issue, start=local(2025, 3, 20, 23), end=local(2025, 3, 20, 23, 30))
+        self.assertEqual((work.jalali_year, work.jalali_month, work.wage_month), (1403, 12, 'اسفند'))
+        work.start, work.end = local(2025, 3, 21, 0, 10), local(2025, 3, 21, 1)
+        work.save(update_fields=['start', 'end'])
+        self.assertEqual(Work.objects.filter(pk=work.pk).values_list('jalali_year', 'jalali_month', 'wage_month').get(),
+                         (1404, 1, 'فروردین'))
+        self.assertEqual(payroll.check(), [])
+
+    def test_filters_and_exports_use_the_month_key(self):
+        self.client.force_login(self.user)
+        farvardin = Work.objects.filter(work_date__gte=date(2025, 3, 21))
+        response = self.client.get('/admin/linear/work/', {'month': '1404-01'})
+        self.assertEqual(response.context['cl'].result_count, farvardin.count())
+        self.assertEqual([choice[0] for choice in response.context['cl'].filter_specs[0].lookup_choices],
+                         ['1404-01', '1403-12'])
+        works = self.client.get('/linear/api/works/', {'wage_month': 'فروردین', 'limit': 1000}).json()['results']
+        self.assertEqual({row['id'] for row in works}, set(farvardin.values_list('id', flat=True)))
+        self.assertEqual(self.client.get('/linear/api/works/', {'wage_month': 'x'}).status_code, 400)
+
+        rows = list(csv.DictReader(b''.join(stream_csv(WorkResource(), farvardin)).decode().splitlines()))
+        self.assertEqual({row['month'] for row in rows}, {'1404-01'})
+
+
+@override_settings(LINEAR_CHANGE_FEED_OVERLAP=0)
+class ChangeFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.issue = Issue.objects.create(title="feed")
+        cls.other = Issue.objects.create(title="untouched")
+        make_works(cls.issue, days=10, seed=51)
+        Work.objects.create(issue=cls.other, start=local(2025, 4, 1, 9), end=local(2025, 4, 1, 10))
+        # Everything above predates the watermark of the tests
+        old = timezone.now() - timedelta(days=2)
+        for model in (Issue, Work, DailyLedger):
+            model.objects.update(updated_at=old)
+        cls.since = timezone.now() - timedelta(days=1)
+
+    def test_edited_work_brings_its_day(self):
+        self.assertEqual(len(list(changes.records('work'))), Work.objects.count())
+        self.assertEqual(list(changes.records('work', self.since)), [])
+        work = Work.objects.filter(issue=self.issue).order_by('start').first()
+        work.end += timedelta(hours=9)
+        work.save()
+        records = list(changes.records('work', self.since))
+        same_day = Work.objects.filter(work_date=work.work_date).with_ledger_overwork()
+        self.assertEqual({(r['id'], r['overwork_duration']) for r in records},
+                         {(w.pk, w.overwork_duration) for w in same_day})
+        self.assertEqual({r['op'] for r in records}, {'upsert'})
+        self.assertEqual([r['id'] for r in changes.records('issue', self.since)], [self.issue.pk])
+
+    def test_deletions_are_reported(self):
+        work_id, issue_id = Work.objects.get(issue=self.other).pk, self.other.pk
+        Work.objects.get(pk=work_id).delete()
+        self.other.delete()
+        self.assertEqual(Tombstone.objects.count(), 2)
+        self.assertIn({'op': 'delete', 'id': work_id, 'updated_at': Tombstone.objects.get(model='work').deleted_at},
+                      list(changes.records('work', self.since)))
+        self.assertEqual([(r['op'], r['id']) for r in changes.records('issue', self.since)], [('delete', issue_id)])
+
+    def test_tombstones_are_pruned_after_the_retention(self):
+        Work.objects.get(issue=self.other).delete()
+        out = StringIO()
+        call_command('prune_tombstones', stdout=out)
+        self.assertIn("Pruned 0 tombstones", out.getvalue())
+        later = timezone.now() + timedelta(days=settings.LINEAR_TOMBSTONE_RETENTION_DAYS, seconds=1)
+        self.assertEqual(changes.prune(now=later), 1)
+        self.assertFalse(Tombstone.objects.exists())
+
+        # A watermark from before the retention could miss pruned deletions
+        stale = timezone.now() - timedelta(days=settings.LINEAR_TOMBSTONE_RETENTION_DAYS, seconds=1)
+        with self.assertRaisesMessage(ValueError, "tombstone retention"):
+            changes.parse_since(stale.isoformat())
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/linear/api/changes/', {'since': stale.isoformat()}).status_code, 400)
+
+    def test_endpoint_and_command(self):
+        self.client.force_login(self.user)
+        Work.objects.filter(issue=self.other).update(description="x", updated_at=timezone.now())
+        response = self.client.get('/linear/api/changes/', {'since': self.since.isoformat(), 'format': 'csv'})
+        self.assertIsInstance(response, StreamingHttpResponse)
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([(row['op'], row['issue']) for row in rows], [('upsert', str(self.other.pk))])
+        self.assertGreater(changes.parse_since(response['X-Linear-Watermark']), self.since)
+        self.assertEqual(self.client.get('/linear/api/changes/', {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/linear/api/changes/', {'model': 'job'}).status_code, 400)
+
+        out, err = StringIO(), StringIO()
+        call_command('export_changes', since=self.since.isoformat(), stdout=out, stderr=err)
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([str(line['id']) for line in lines], [row['id'] for row in rows])
+        self.assertTrue(err.getvalue().startswith('watermark '))
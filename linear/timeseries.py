@@ -0,0 +1,168 @@
+"""
+Hours, overwork and work counts per day, week or month.
+
+Each bucket is cached on its own under a version kept in the database
+(linear.versions), so a ledger refresh in any process moves only the
+buckets of the days it touched, and one grouped query recomputes the
+missing buckets of a range. A multi-year series costs two version
+queries and a cache read once it is warm.
+"""
+import math
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DateField, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+from . import versions
+
+VERSION = 'timeseries'
+TRUNCATE = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+EMPTY = (timedelta(), timedelta(), 0)
+# Longest range a report may ask for, about ten years
+MAX_DAYS = 3660
+
+
+def bucket_start(kind, day):
+    """
+    First date of the `kind` bucket holding `day`; weeks start on Monday
+    like TruncWeek.
+    """
+    if kind == 'day':
+        return day
+    if kind == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_bucket(kind, start):
+    if kind == 'day':
+        return start + timedelta(days=1)
+    if kind == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=31)).replace(day=1)
+
+
+def buckets(kind, date_from, date_to):
+    """
+    Start dates of the `kind` buckets covering date_from..date_to.
+    """
+    start = bucket_start(kind, date_from)
+    while start <= date_to:
+        yield start
+        start = next_bucket(kind, start)
+
+
+def _name(kind, start):
+    # Version name of one bucket; ISO dates keep a range of them in order
+    return f"{VERSION}:{kind}:{start.isoformat()}"
+
+
+def _key(version, bucket_version, kind, start):
+    return f"linear:timeseries:{version}:{kind}:{start.isoformat()}:{bucket_version}"
+
+
+def compute(kind, date_from, date_to):
+    """
+    {bucket start: (total duration, overwork, work count)} of the works
+    starting in date_from..date_to, in one query grouped by the bucket
+    of their local start time. Overwork is read from the daily ledger.
+    """
+    from .models import Work
+
+    truncate = TRUNCATE[kind]('start', output_field=DateField(), tzinfo=timezone.get_current_timezone())
+    rows = Work.objects.filter(work_date__gte=date_from, work_date__lte=date_to).with_ledger_overwork().values(
+        bucket=truncate,
+    ).annotate(
+        total=Sum(ExpressionWrapper(F('end') - F('start'), output_field=DurationField())),
+        overwork=Sum('overwork_duration'),
+        count=Count('id'),
+    ).order_by()
+    return {row['bucket']: (row['total'] or timedelta(), row['overwork'] or timedelta(), row['count']) for row in rows}
+
+
+def series(kind, date_from, date_to):
+    """
+    [(bucket start, total duration, overwork, work count)] of every bucket
+    overlapping date_from..date_to, empty buckets included. Buckets are
+    read from the cache; the missing ones are computed together and
+    cached. Edge buckets cover whole weeks or months.
+    """
+    starts = list(buckets(kind, date_from, date_to))
+    if not starts:
+        return []
+    version = versions.get(VERSION)
+    bumped = versions.get_range(_name(kind, starts[0]), _name(kind, starts[-1]))
+    keys = {start: _key(version, bumped.get(_name(kind, start), ''), kind, start) for start in starts}
+    cached = cache.get_many(keys.values())
+    missing = [start for start in starts if keys[start] not in cached]
+    if missing:
+        computed = compute(kind, missing[0], next_bucket(kind, missing[-1]) - timedelta(days=1))
+        fresh = {keys[start]: computed.get(start, EMPTY) for start in missing}
+        cache.set_many(fresh, settings.LINEAR_SUMMARY_CACHE_TIMEOUT)
+        cached.update(fresh)
+    return [(start, *cached[keys[start]]) for start in starts]
+
+
+def invalidate(days):
+    """
+    Move the buckets holding `days` to new versions. The bump commits with
+    the refresh, so a report running meanwhile caches under the version
+    it read and cannot leave a stale bucket behind.
+    """
+    versions.bump(*{_name(kind, bucket_start(kind, day)) for kind in TRUNCATE for day in set(days)})
+
+
+def clear():
+    """
+    Drop every cached bucket, in every process, by moving to a new
+    version.
+    """
+    versions.bump(VERSION)
+
+
+def default_range(today=None):
+    """
+    The year up to `today` (the local date by default).
+    """
+    today = today or timezone.localdate()
+    return today - timedelta(days=364), today
+
+
+def heatmap(days, levels=4):
+    """
+    Seven rows, Monday first, of one (date, hours, level) cell per week
+    of a day series. `level` runs from 0 for no work to `levels` for the
+    busiest day; cells outside the series are None.
+    """
+    if not days:
+        return []
+    hours = {start: total.total_seconds() / 3600 for start, total, _, _ in days}
+    busiest = max(hours.values()) or 1
+    weeks = list(buckets('week', days[0][0], days[-1][0]))
+    rows = []
+    for offset in range(7):
+        row = []
+        for week in weeks:
+            day = week + timedelta(days=offset)
+            row.append((day, round(hours[day], 2), math.ceil(hours[day] / busiest * levels)) if day in hours else None)
+        rows.append(row)
+    return rows
+
+
+def parse_range(params, today=None):
+    """
+    (kind, date_from, date_to) from `bucket`, `date_from` and `date_to`
+    parameters, defaulting to days over the past year. Raises ValueError.
+    """
+    kind = params.get('bucket', 'day')
+    if kind not in TRUNCATE:
+        raise ValueError(f"bucket must be one of {', '.join(TRUNCATE)}.")
+    date_from, date_to = default_range(today)
+    date_from = date.fromisoformat(params['date_from']) if params.get('date_from') else date_from
+    date_to = date.fromisoformat(params['date_to']) if params.get('date_to') else date_to
+    if date_from > date_to:
+        raise ValueError("date_from must not be after date_to.")
+    if (date_to - date_from).days > MAX_DAYS:
+        raise ValueError(f"The range may span at most {MAX_DAYS} days.")
+    return kind, date_from, date_to
@@ -0,0 +1,62 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+from .models import Issue, Work
+from .sqlite import chunked
+
+EMPTY = (timedelta(), timedelta(), 0)
+
+
+def _totals(issue_ids):
+    """
+    {issue id: (total duration, total overwork, work count)} of the Issues
+    with works among `issue_ids`, with overwork read from the daily ledger
+    in the same grouped query.
+    """
+    rows = Work.objects.filter(issue__in=issue_ids).with_ledger_overwork().values('issue').annotate(
+        total=Sum(ExpressionWrapper(F('end') - F('start'), output_field=DurationField())),
+        overwork=Sum('overwork_duration'),
+        count=Count('id'),
+    ).order_by()
+    return {row['issue']: (row['total'] or timedelta(), row['overwork'] or timedelta(), row['count']) for row in rows}
+
+
+def refresh(issue_ids):
+    """
+    Recompute the stored totals of the given Issues. Must run after the
+    ledger rows of their works' days are up to date.
+    """
+    with transaction.atomic():
+        for chunk in chunked(sorted(set(issue_ids))):
+            totals = _totals(chunk)
+            # bulk_update skips auto_now; the change feed needs the new totals
+            now = timezone.now()
+            Issue.objects.bulk_update(
+                (Issue(pk=pk, updated_at=now, **dict(zip(Issue.TOTAL_FIELDS, totals.get(pk, EMPTY)))) for pk in chunk),
+                [*Issue.TOTAL_FIELDS, 'updated_at'],
+            )
+
+
+def rebuild():
+    """
+    Recompute the totals of every Issue. Returns the number of Issues.
+    """
+    issue_ids = list(Issue.objects.values_list('pk', flat=True))
+    refresh(issue_ids)
+    return len(issue_ids)
+
+
+def check():
+    """
+    Compare the stored totals with a live computation. Returns a list of
+    (issue id, field, stored, live) differences.
+    """
+    differences = []
+    stored = Issue.objects.order_by('pk').values_list('pk', *Issue.TOTAL_FIELDS)
+    live = _totals(Issue.objects.values('pk'))
+    for pk, *values in stored:
+        for field, stored_value, live_value in zip(Issue.TOTAL_FIELDS, values, live.get(pk, EMPTY)):
+            if stored_value != live_value:
+                differences.append((pk, field, stored_value, live_value))
+    return differences
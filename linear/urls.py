@@ -0,0 +1,17 @@
+from django.urls import path
+from . import views
+
+app_name = 'linear'
+
+urlpatterns = [
+    path('payroll/', views.payroll_report, name='payroll'),
+    path('payroll/<int:year>/<int:month>/', views.payroll_report, name='payroll_month'),
+    path('api/works/', views.work_list, name='api_works'),
+    path('api/issues/', views.issue_list, name='api_issues'),
+    path('api/days/', views.day_list, name='api_days'),
+    path('api/months/', views.month_list, name='api_months'),
+    path('api/summary/', views.summary_report, name='api_summary'),
+    path('api/summary/days/', views.day_report, name='api_day_summary'),
+    path('api/timeseries/', views.timeseries_report, name='api_timeseries'),
+    path('api/changes/', views.change_feed, name='api_changes'),
+]
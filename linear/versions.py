@@ -0,0 +1,36 @@
+"""
+Cache versions kept in the database.
+
+Cached values live in each process's own cache, so a version there would
+only reach the process that bumped it. The versions are read from the
+database instead: a bump in a request, a worker or a shell starts a fresh
+key space everywhere, and rolls back with the transaction that made it.
+"""
+import uuid
+from .models import CacheVersion
+
+
+def get(name):
+    """
+    Current version of `name`; '' until it is first bumped.
+    """
+    return CacheVersion.objects.filter(name=name).values_list('version', flat=True).first() or ''
+
+
+def get_range(first, last):
+    """
+    {name: version} of the bumped names from `first` to `last`, compared
+    as strings.
+    """
+    return dict(CacheVersion.objects.filter(name__range=(first, last)).values_list('name', 'version'))
+
+
+def bump(*names):
+    """
+    Give each of `names` a new version, in one query.
+    """
+    if names:
+        CacheVersion.objects.bulk_create(
+            [CacheVersion(name=name, version=uuid.uuid4().hex) for name in set(names)],
+            update_conflicts=True, unique_fields=['name'], update_fields=['version'],
+        )
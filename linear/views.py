@@ -1,3 +1,382 @@
-from django.shortcuts import render
+import asyncio
+import base64
+import json
+from datetime import date, timedelta
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import ValidationError
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import conditional_page, require_GET
+from .models import DailyLedger, Issue, PayrollRollup, Work
+from .payroll import month_totals
+from . import changes, jalali, policy, routers, timeseries
+from .summary import summary_context
 
-# Create your views here.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+WORK_FIELDS = (
+    'id', 'issue', 'start', 'end', 'work_date', 'jalali_year', 'jalali_month', 'wage_month', 'overwork_day',
+    'description', 'overwork_duration',
+)
+DEFAULT_WORK_FIELDS = ('id', 'issue', 'start', 'end', 'jalali_year', 'jalali_month', 'overwork_day', 'overwork_duration')
+DAY_FIELDS = ('id', 'day', 'end_day', 'total_duration', 'nine_hour_mark', 'overwork', 'work_count')
+
+
+def hours(duration):
+    return round(duration.total_seconds() / 3600, 2)
+
+
+def _month(totals):
+    return {
+        'jalali_year': totals['jalali_year'],
+        'jalali_month': totals['jalali_month'],
+        'wage_month': totals['wage_month'],
+        'regular_hours': hours(totals['regular_duration']),
+        'overwork_hours': hours(totals['overwork_duration']),
+        'value': totals['value'],
+    }
+
+
+@staff_member_required
+def payroll_report(request, year=None, month=None):
+    """
+    Payroll rollups as JSON: every Jalali month's totals, or one month's
+    totals with a row per Issue.
+    """
+    if year is None:
+        return JsonResponse({'months': [_month(totals) for totals in month_totals()]})
+
+    rollups = PayrollRollup.objects.filter(jalali_year=year, jalali_month=month)
+    totals = month_totals(rollups)
+    if not totals:
+        raise Http404("No payroll for this wage month.")
+    return JsonResponse({
+        **_month(totals[0]),
+        'issues': [
+            {
+                'issue': row.issue_id,
+                'title': row.issue.title,
+                'policy_from': row.policy_from,
+                'regular_hours': hours(row.regular_duration),
+                'overwork_hours': hours(row.overwork_duration),
+                'value': row.value,
+            }
+            for row in rollups.select_related('issue').order_by('issue', 'policy_from')
+        ],
+    })
+
+
+class BadRequest(Exception):
+    pass
+
+
+def int_param(request, name):
+    try:
+        value = int(request.GET[name])
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer.")
+    # Larger values do not fit a database integer
+    if not -2 ** 63 <= value < 2 ** 63:
+        raise BadRequest(f"{name} is out of range.")
+    return value
+
+
+def date_param(request, name):
+    try:
+        return date.fromisoformat(request.GET[name])
+    except ValueError:
+        raise BadRequest(f"{name} must be a date (YYYY-MM-DD).")
+
+
+def filter_works(request, works):
+    """
+    Apply the issue, jalali_year, jalali_month, wage_month (a month name),
+    date_from and date_to (local work date) parameters of `request` to
+    `works`. Months are matched on the integer Jalali month key.
+    """
+    for name in ('issue', 'jalali_year', 'jalali_month'):
+        if name in request.GET:
+            works = works.filter(**{name: int_param(request, name)})
+    for name, lookup in (('date_from', 'work_date__gte'), ('date_to', 'work_date__lte')):
+        if name in request.GET:
+            works = works.filter(**{lookup: date_param(request, name)})
+    if 'wage_month' in request.GET:
+        try:
+            works = works.filter(jalali_month=jalali.month_number(request.GET['wage_month']))
+        except ValueError:
+            raise BadRequest("Unknown wage_month.")
+    return works
+
+
+def filter_days(request, days):
+    if 'date_from' in request.GET:
+        days = days.filter(day__gte=date_param(request, 'date_from'))
+    if 'date_to' in request.GET:
+        days = days.filter(day__lte=date_param(request, 'date_to'))
+    return days
+
+
+def json_row(row):
+    """
+    A values() row with its durations in hours.
+    """
+    return {name: hours(value) if isinstance(value, timedelta) else value for name, value in row.items()}
+
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise BadRequest("Invalid cursor.")
+    if not isinstance(values, list):
+        raise BadRequest("Invalid cursor.")
+    return values
+
+
+def keyset_page(request, queryset, key, fields):
+    """
+    One page of `queryset` as a JSON response, ordered by (`key`, id) and
+    continued from the `cursor` parameter instead of an OFFSET, so every
+    page costs the same however deep it is. Rows are read with values()
+    and durations are reported in hours.
+    """
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        raise BadRequest("limit must be an integer.")
+    if limit < 1:
+        raise BadRequest("limit must be positive.")
+
+    ordering = [key, 'id'] if key != 'id' else ['id']
+    if 'cursor' in request.GET:
+        values = decode_cursor(request.GET['cursor'])
+        if len(values) != len(ordering):
+            raise BadRequest("Invalid cursor.")
+        try:
+            values = [queryset.model._meta.get_field(name).to_python(value) for name, value in zip(ordering, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise BadRequest("Invalid cursor.")
+        if key == 'id':
+            queryset = queryset.filter(id__gt=values[0])
+        else:
+            queryset = queryset.filter(Q(**{f'{key}__gt': values[0]}) | Q(**{key: values[0], 'id__gt': values[1]}))
+
+    rows = list(queryset.order_by(*ordering).values(*dict.fromkeys([*ordering, *fields]))[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*(rows[-1][name] for name in ordering))
+    return JsonResponse({'results': [json_row(row) for row in rows], 'next': next_cursor})
+
+
+def selected_fields(request, allowed, default):
+    if 'fields' not in request.GET:
+        return default
+    fields = [name for name in request.GET['fields'].split(',') if name]
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(sorted(unknown))}.")
+    return fields
+
+
+def api_view(view):
+    """
+    Staff-only, read-only JSON view with ETag/conditional GET handling,
+    reading from the read database. BadRequest turns into a 400 response.
+    Async views stay async.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                with routers.reads():
+                    return await view(request, *args, **kwargs)
+            except BadRequest as e:
+                return JsonResponse({'error': str(e)}, status=400)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                with routers.reads():
+                    return view(request, *args, **kwargs)
+            except BadRequest as e:
+                return JsonResponse({'error': str(e)}, status=400)
+    return staff_member_required(require_GET(conditional_page(wrapper)))
+
+
+@api_view
+def work_list(request):
+    """
+    Works ordered by (start, id). Filters: issue, wage_month, date_from,
+    date_to (local work dates). `fields` picks the columns.
+    """
+    fields = selected_fields(request, WORK_FIELDS, DEFAULT_WORK_FIELDS)
+    works = filter_works(request, Work.objects.all())
+    if 'overwork_duration' in fields:
+        works = works.with_ledger_overwork()
+    return keyset_page(request, works, 'start', fields)
+
+
+@api_view
+def issue_list(request):
+    """
+    Issues ordered by id with their stored totals.
+    """
+    return keyset_page(request, Issue.objects.all(), 'id', ('id', 'title', *Issue.TOTAL_FIELDS))
+
+
+@api_view
+def day_list(request):
+    """
+    Daily ledger rows ordered by (day, id). Filters: date_from, date_to.
+    """
+    return keyset_page(request, filter_days(request, DailyLedger.objects.all()), 'day', DAY_FIELDS)
+
+
+@api_view
+def month_list(request):
+    """
+    Hours and pay per wage month, from the payroll rollups.
+    """
+    return JsonResponse({'results': [_month(totals) for totals in month_totals()]})
+
+
+def series_rows(series):
+    return [
+        {'start': start, 'hours': hours(total), 'overwork_hours': hours(overwork), 'work_count': count}
+        for start, total, overwork, count in series
+    ]
+
+
+@api_view
+def timeseries_report(request):
+    """
+    Hours, overwork hours and work count per `bucket` (day, week or
+    month) of local start time, from date_from to date_to (the past year
+    by default).
+    """
+    try:
+        kind, date_from, date_to = timeseries.parse_range(request.GET)
+    except ValueError as e:
+        raise BadRequest(str(e))
+    return JsonResponse({
+        'bucket': kind,
+        'date_from': date_from,
+        'date_to': date_to,
+        'results': series_rows(timeseries.series(kind, date_from, date_to)),
+    })
+
+
+@staff_member_required
+@require_GET
+def change_feed(request):
+    """
+    Streamed `model` (work or issue) rows changed or deleted since the
+    `since` watermark, as `format` jsonl or csv. The X-Linear-Watermark
+    header is the `since` of the next call. Reads the primary database so
+    no change is missed behind a lagging replica. A `since` older than
+    LINEAR_TOMBSTONE_RETENTION_DAYS is a 400: its deletions may be pruned.
+    """
+    model = request.GET.get('model', 'work')
+    format = request.GET.get('format', 'jsonl')
+    if model not in changes.MODELS:
+        return JsonResponse({'error': f"model must be one of {', '.join(changes.MODELS)}."}, status=400)
+    if format not in changes.FORMATS:
+        return JsonResponse({'error': f"format must be one of {', '.join(changes.FORMATS)}."}, status=400)
+    try:
+        since = changes.parse_since(request.GET.get('since'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    watermark = changes.watermark()
+    response = StreamingHttpResponse(
+        changes.stream(model, since, format),
+        content_type='text/csv' if format == 'csv' else 'application/jsonl',
+    )
+    response['X-Linear-Watermark'] = watermark.isoformat()
+    return response
+
+
+def _totals(rows, policies):
+    """
+    Combine per policy period rows of total_duration, total_overwork and
+    work_count, paying each period at its own rates.
+    """
+    total_duration = total_overwork = timedelta()
+    work_count = value = 0
+    for row in rows:
+        period_duration = row['total_duration'] or timedelta()
+        period_overwork = row['total_overwork'] or timedelta()
+        total_duration += period_duration
+        total_overwork += period_overwork
+        work_count += row['work_count'] or 0
+        value += policies.period(row['policy_from']).value(period_duration, period_overwork)
+    return {
+        'work_count': work_count,
+        'total_hours': hours(total_duration),
+        'overwork_hours': hours(total_overwork),
+        **summary_context(total_duration, total_overwork, value),
+    }
+
+
+async def _work_totals(works, policies):
+    rows = works.with_ledger_overwork().values(policy_from=policies.period_expression()).annotate(
+        total_duration=Sum(ExpressionWrapper(F('end') - F('start'), output_field=DurationField())),
+        total_overwork=Sum('overwork_duration'),
+        work_count=Count('id'),
+    ).order_by()
+    return _totals([row async for row in rows], policies)
+
+
+async def _day_totals(days, policies):
+    rows = days.values(policy_from=policies.period_expression('day')).annotate(
+        day_count=Count('id'),
+        overwork_days=Count('id', filter=Q(overwork__gt=timedelta())),
+        total_duration=Sum('total_duration'),
+        total_overwork=Sum('overwork'),
+        work_count=Sum('work_count'),
+    ).order_by()
+    rows = [row async for row in rows]
+    return {
+        'day_count': sum(row['day_count'] for row in rows),
+        'overwork_days': sum(row['overwork_days'] for row in rows),
+        **_totals(rows, policies),
+    }
+
+
+@api_view
+async def summary_report(request):
+    """
+    Totals of the Works matching the work_list filters, the Issues they
+    belong to and the ledger days in the date range. The aggregates are
+    independent and awaited together.
+    """
+    works = filter_works(request, Work.objects.all())
+    policies = await sync_to_async(policy.table)()
+    work_totals, issue_count, day_totals = await asyncio.gather(
+        _work_totals(works, policies),
+        Issue.objects.filter(pk__in=works.values('issue')).acount(),
+        _day_totals(filter_days(request, DailyLedger.objects.all()), policies),
+    )
+    return JsonResponse({'works': work_totals, 'issue_count': issue_count, 'days': day_totals})
+
+
+@api_view
+async def day_report(request):
+    """
+    Every ledger day in the date_from/date_to range with the range totals.
+    """
+    days = filter_days(request, DailyLedger.objects.all())
+
+    async def rows():
+        return [json_row(row) async for row in days.order_by('day', 'end_day').values(*DAY_FIELDS)]
+
+    policies = await sync_to_async(policy.table)()
+    results, totals = await asyncio.gather(rows(), _day_totals(days, policies))
+    return JsonResponse({'results': results, 'totals': totals})